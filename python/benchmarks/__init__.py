@@ -0,0 +1 @@
+"""Benchmarks of skyboxdatapy, in the asv format."""
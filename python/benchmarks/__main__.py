@@ -0,0 +1,15 @@
+"""Run all benchmarks without asv: `python -m benchmarks` from the `python` folder."""
+
+from .common import run
+from .bench_import import TimeImport
+from .bench_io import TimeCleanAttributes, TimeLoadCase, TimeConvertDictToXarray
+from .bench_postprocess import TimeTare, TimeSync
+from .bench_spec import TimeSpectrum, TimeBulkParameters
+from .bench_preview import TimePyramid
+from .bench_stats import TimeWaveStatistics
+from .bench_dtype import TimeLoadCaseDtype, TrackFloat32
+
+
+run([TimeImport, TimeCleanAttributes, TimeLoadCase, TimeConvertDictToXarray,
+    TimeTare, TimeSync, TimeSpectrum, TimeBulkParameters, TimePyramid,
+    TimeWaveStatistics, TimeLoadCaseDtype, TrackFloat32])
@@ -0,0 +1,86 @@
+"""float32 against float64 probe storage.
+
+The `track_` benchmarks report the largest relative difference between the
+float32 and float64 data paths, asv keeps their history with the timings.
+Run with asv, or without it with `python -m benchmarks.bench_dtype` from the
+`python` folder.
+"""
+
+import numpy as np
+
+from skyboxdatapy import io as skb_io
+from skyboxdatapy import postprocess as skb_pp
+from skyboxdatapy import spec as skb_spec
+
+from .common import fSampling, get_case_file, run
+
+
+# ==============================================================================
+
+def _rel_diff(a, b) -> float:
+    """Largest difference of a and b relative to the largest value of b."""
+
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return float(np.nanmax(np.abs(a - b)) / np.nanmax(np.abs(b)))
+
+
+# ==============================================================================
+
+class TimeLoadCaseDtype:
+    """Load a 60 s case as float64 or float32."""
+
+    params = ["float64", "float32"]
+    param_names = ["dtype"]
+
+    def setup(self, dtype):
+        self.file = get_case_file(60.0)
+
+    def time_load_case(self, dtype):
+        skb_io.load_case(self.file, groups=["DefaultData"], dtype=dtype)
+
+    def peakmem_load_case(self, dtype):
+        skb_io.load_case(self.file, groups=["DefaultData"], dtype=dtype)
+
+    def track_nbytes(self, dtype):
+        return skb_io.load_case(self.file, groups=["DefaultData"],
+            dtype=dtype)["DefaultData"].nbytes
+
+
+class TrackFloat32:
+    """Relative difference of the float32 path to the float64 path."""
+
+    def setup(self):
+        file = get_case_file(60.0)
+        self.ds64 = skb_io.load_case(file, groups=["DefaultData"])["DefaultData"]
+        self.ds32 = skb_io.load_case(file, groups=["DefaultData"],
+            dtype=np.float32)["DefaultData"]
+
+    def track_load_case(self):
+        return _rel_diff(self.ds32["WG01"], self.ds64["WG01"])
+
+    def track_tare(self):
+        a = skb_pp.set_all_probe_tare(self.ds32, 0.0, 2.0)
+        b = skb_pp.set_all_probe_tare(self.ds64, 0.0, 2.0)
+        return _rel_diff(a["WG01"], b["WG01"])
+
+    def track_resample(self):
+        a = skb_pp.resample_to(self.ds32, 100, fSampling)
+        b = skb_pp.resample_to(self.ds64, 100, fSampling)
+        return _rel_diff(a["WG01"], b["WG01"])
+
+    def track_spectra(self):
+        a = skb_spec.get_spectra(self.ds32, fSampling)
+        b = skb_spec.get_spectra(self.ds64, fSampling)
+        return _rel_diff(a["psd"], b["psd"])
+
+    def track_hm0(self):
+        a = skb_spec.get_bulk_parameters(skb_spec.get_spectra(self.ds32, fSampling), fmin=0.1)
+        b = skb_spec.get_bulk_parameters(skb_spec.get_spectra(self.ds64, fSampling), fmin=0.1)
+        return _rel_diff(a["Hm0"], b["Hm0"])
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimeLoadCaseDtype, TrackFloat32])
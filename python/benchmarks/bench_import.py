@@ -0,0 +1,16 @@
+"""Import time of the package and its submodules, in a fresh interpreter."""
+
+
+class TimeImport:
+
+    def timeraw_import_package(self):
+        return "import skyboxdatapy"
+
+    def timeraw_import_spec(self):
+        return "import skyboxdatapy.spec"
+
+    def timeraw_import_io(self):
+        return "import skyboxdatapy.io"
+
+    def timeraw_import_postprocess(self):
+        return "import skyboxdatapy.postprocess"
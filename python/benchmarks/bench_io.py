@@ -0,0 +1,104 @@
+"""Benchmarks of `skyboxdatapy.io`.
+
+Run with asv, or without it with `python -m benchmarks.bench_io` from the
+`python` folder (`python -m benchmarks` runs all benchmarks).
+"""
+
+import numpy as np
+
+from skyboxdatapy import io as skb_io
+
+from .common import make_case, get_case_file, run
+
+
+# ==============================================================================
+
+def make_struct(n_fields, n_chars, n_samples=2000) -> np.ndarray:
+    """
+    Synthetic struct as returned by `hdf5storage.loadmat`.
+
+    Half of the fields are char arrays of `n_chars` characters, the other half
+    column vectors of `n_samples` samples.
+    """
+
+    fields = []
+    for i in range(n_fields):
+        if i % 2 == 0:
+            fields.append((f"text{i:03d}", "<U1", (n_chars, 1)))
+        else:
+            fields.append((f"data{i:03d}", "<f8", (n_samples, 1)))
+
+    l1 = np.zeros(1, dtype=fields)
+    chars = np.array(list("SkyBox wave impact "))
+    for name, kind, shape in fields:
+        if kind == "<U1":
+            l1[name] = np.resize(chars, shape)
+        else:
+            l1[name] = np.random.default_rng(0).normal(size=shape)
+    return l1
+
+
+# ==============================================================================
+
+class TimeCleanAttributes:
+    """Decoding of structs with many fields and long char arrays."""
+
+    params = ([10, 100], [16, 4096])
+    param_names = ["n_fields", "n_chars"]
+
+    def setup(self, n_fields, n_chars):
+        self.l1 = make_struct(n_fields, n_chars)
+
+    def time_cleanAttributes(self, n_fields, n_chars):
+        skb_io.cleanAttributes(self.l1)
+
+
+# ==============================================================================
+
+class TimeLoadCase:
+    """Loading a synthetic v7.3 case, in full and a selection."""
+
+    params = [10.0, 60.0]
+    param_names = ["duration"]
+    timeout = 600
+
+    def setup(self, duration):
+        self.file = get_case_file(duration)
+
+    def time_load_case(self, duration):
+        skb_io.load_case(self.file)
+
+    def time_load_case_selection(self, duration):
+        skb_io.load_case(self.file, groups=["DefaultData", "TestProperties"],
+            probes=["WG01", "PS01"], time=(2.0, 8.0))
+
+    def peakmem_load_case(self, duration):
+        skb_io.load_case(self.file)
+
+    def peakmem_load_case_selection(self, duration):
+        skb_io.load_case(self.file, groups=["DefaultData", "TestProperties"],
+            probes=["WG01", "PS01"], time=(2.0, 8.0))
+
+
+# ==============================================================================
+
+class TimeConvertDictToXarray:
+    """Conversion of a 60 s DefaultData group to a Dataset."""
+
+    params = ["variables", "stacked"]
+    param_names = ["layout"]
+
+    def setup(self, layout):
+        self.data = make_case(60.0)["DefaultData"]
+
+    def time_convert_dict_to_xarray(self, layout):
+        skb_io.convert_dict_to_xarray(self.data, layout=layout)
+
+    def peakmem_convert_dict_to_xarray(self, layout):
+        skb_io.convert_dict_to_xarray(self.data, layout=layout)
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimeCleanAttributes, TimeLoadCase, TimeConvertDictToXarray])
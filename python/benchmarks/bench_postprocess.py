@@ -0,0 +1,75 @@
+"""Benchmarks of `skyboxdatapy.postprocess`.
+
+Run with asv, or without it with `python -m benchmarks.bench_postprocess`
+from the `python` folder.
+"""
+
+from skyboxdatapy import io as skb_io
+from skyboxdatapy import postprocess as skb_pp
+
+from .common import make_case, fSampling, run
+
+
+# ==============================================================================
+
+def make_dataset(duration=60.0):
+    """DefaultData of a synthetic case as a Dataset."""
+
+    return skb_io.convert_dict_to_xarray(make_case(duration)["DefaultData"])
+
+
+# ==============================================================================
+
+class TimeTare:
+    """Tare of all probes of a 60 s case."""
+
+    params = ["copy", "inplace", "lazy"]
+    param_names = ["mode"]
+
+    def setup(self, mode):
+        self.ds = make_dataset()
+
+    def time_set_all_probe_tare(self, mode):
+        skb_pp.set_all_probe_tare(self.ds, 0.0, 2.0, mode=mode)
+
+    def peakmem_set_all_probe_tare(self, mode):
+        skb_pp.set_all_probe_tare(self.ds, 0.0, 2.0, mode=mode)
+
+
+# ==============================================================================
+
+class TimeSync:
+    """Cross-correlation sync of a wave gauge with a shifted copy at half rate."""
+
+    timeout = 300
+
+    def setup(self):
+        ds = make_dataset()
+        self.da1 = ds["WG01"]
+        self.da2 = ds["WG01"].shift(Time=250).dropna("Time")[::2]
+
+    def time_sync_signals_crosscorr_downsample(self):
+        skb_pp.sync_signals_crosscorr_downsample(
+            self.da1, fSampling, self.da2, fSampling / 2)
+
+    def time_sync_signals_crosscorr_upsample(self):
+        skb_pp.sync_signals_crosscorr_upsample(
+            self.da1, fSampling, self.da2, fSampling / 2)
+
+    def time_sync_signals_crosscorr_bounded(self):
+        skb_pp.sync_signals_crosscorr_bounded(
+            self.da1, fSampling, self.da2, fSampling / 2, max_lag=2.0)
+
+    def peakmem_sync_signals_crosscorr_downsample(self):
+        skb_pp.sync_signals_crosscorr_downsample(
+            self.da1, fSampling, self.da2, fSampling / 2)
+
+    def peakmem_sync_signals_crosscorr_upsample(self):
+        skb_pp.sync_signals_crosscorr_upsample(
+            self.da1, fSampling, self.da2, fSampling / 2)
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimeTare, TimeSync])
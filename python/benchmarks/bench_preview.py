@@ -0,0 +1,42 @@
+"""Benchmarks of `skyboxdatapy.preview`.
+
+Run with asv, or without it with `python -m benchmarks.bench_preview` from the
+`python` folder.
+"""
+
+from skyboxdatapy import preview as skb_preview
+
+from .common import run
+from .bench_postprocess import make_dataset
+
+
+# ==============================================================================
+
+class TimePyramid:
+    """Pyramid of all probes of a 180 s case and the level of a plot."""
+
+    timeout = 300
+
+    def setup(self):
+        self.ds = make_dataset(180.0)
+        self.pyramid = skb_preview.build_pyramid(self.ds, probes=["WG01"])
+
+    def time_build_pyramid(self):
+        skb_preview.build_pyramid(self.ds)
+
+    def time_select_level_full(self):
+        skb_preview.select_level(self.ds, self.pyramid, "WG01", width=1000).values
+
+    def time_select_level_zoom(self):
+        skb_preview.select_level(self.ds, self.pyramid, "WG01", 60.0, 61.0,
+            width=1000).values
+
+    def track_points_full(self):
+        return skb_preview.select_level(self.ds, self.pyramid, "WG01",
+            width=1000).size
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimePyramid])
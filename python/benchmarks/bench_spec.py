@@ -0,0 +1,63 @@
+"""Benchmarks of `skyboxdatapy.spec`.
+
+Run with asv, or without it with `python -m benchmarks.bench_spec` from the
+`python` folder.
+"""
+
+from skyboxdatapy import spec as skb_spec
+
+from .common import fSampling, get_case_file, run
+from .bench_postprocess import make_dataset
+
+
+# ==============================================================================
+
+class TimeSpectrum:
+    """Spectra of a 60 s case, one probe and all probes at once."""
+
+    def setup(self):
+        self.ds = make_dataset()
+
+    def time_get_single_sided_spectrum(self):
+        skb_spec.get_single_sided_spectrum(self.ds["WG01"].values, fSampling)
+
+    def time_get_spectra(self):
+        skb_spec.get_spectra(self.ds, fSampling)
+
+    def time_get_spectra_welch(self):
+        skb_spec.get_spectra(self.ds, fSampling, method="welch", nperseg=2**14)
+
+    def peakmem_get_spectra(self):
+        skb_spec.get_spectra(self.ds, fSampling)
+
+
+# ==============================================================================
+
+class TimeBulkParameters:
+    """Bulk parameters of 4 cases, with and without memoized spectra."""
+
+    timeout = 300
+
+    def setup(self):
+        self.ds = make_dataset()
+        self.spec = skb_spec.get_spectra(self.ds, fSampling)
+        self.files = [get_case_file(10.0, chunk_time=c)
+            for c in (None, 2**12, 2**14, 2**16)]
+        skb_spec.get_campaign_bulk_parameters(self.files, fmin=0.1)
+
+    def time_get_bulk_parameters(self):
+        skb_spec.get_bulk_parameters(self.spec, fmin=0.1, fmax=5.0,
+            bands={"low": (0.1, 0.8), "peak": (0.8, 1.2)})
+
+    def time_campaign_memoized(self):
+        skb_spec.get_campaign_bulk_parameters(self.files, fmin=0.5, fmax=2.0)
+
+    def time_campaign_cold(self):
+        skb_spec.clear_spectra_memo()
+        skb_spec.get_campaign_bulk_parameters(self.files, fmin=0.5, fmax=2.0)
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimeSpectrum, TimeBulkParameters])
@@ -0,0 +1,34 @@
+"""Benchmarks of `skyboxdatapy.stats`.
+
+Run with asv, or without it with `python -m benchmarks.bench_stats` from the
+`python` folder.
+"""
+
+from skyboxdatapy import stats as skb_stats
+
+from .common import run
+from .bench_postprocess import make_dataset
+
+
+# ==============================================================================
+
+class TimeWaveStatistics:
+    """Zero-crossing statistics of the wave gauges of a 180 s case."""
+
+    params = [None, 2**16]
+    param_names = ["chunk_size"]
+
+    def setup(self, chunk_size):
+        self.ds = make_dataset(180.0)
+
+    def time_get_wave_statistics(self, chunk_size):
+        skb_stats.get_wave_statistics(self.ds, chunk_size=chunk_size)
+
+    def peakmem_get_wave_statistics(self, chunk_size):
+        skb_stats.get_wave_statistics(self.ds, chunk_size=chunk_size)
+
+
+# ==============================================================================
+
+if __name__ == "__main__":
+    run([TimeWaveStatistics])
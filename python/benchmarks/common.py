@@ -0,0 +1,186 @@
+"""Synthetic SkyBox cases and a small runner for the benchmarks.
+
+The synthetic cases have the layout of the converted measurements: the
+MP3Filtered, MP3RawValue and MP3Voltage groups and DefaultData with the
+`all_probe_names` channels at 2000 Hz, and the TestProperties written as
+MATLAB char arrays and doubles, saved as a v7.3 MAT file.
+"""
+
+import io
+import sys
+import timeit
+import tempfile
+import itertools
+import tracemalloc
+import contextlib
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from skyboxdatapy import io as skb_io
+
+
+# ==============================================================================
+
+fSampling = 2000.0
+
+# Folder of the generated MAT files, reused between runs
+case_dir = Path(tempfile.gettempdir()) / "skyboxdatapy_bench"
+
+
+# ==============================================================================
+
+def make_case(duration=60.0, fs=fSampling, seed=0) -> dict:
+    """
+    Synthetic case with the layout of `io.load_hdf5_mat`.
+
+    Wave gauges and motion probes see a regular wave travelling along the
+    flume, the pressure sensors have impacts once per wave period and the
+    LED channel has two pulses.
+
+    Args:
+    - duration: Length of the record in s.
+    - fs: Sampling frequency in Hz.
+    - seed: Seed of the sensor noise.
+
+    Returns:
+    - dict: Groups MP3Filtered, MP3RawValue, MP3Voltage, DefaultData and
+        TestProperties.
+    """
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * fs)) / fs
+    period = 1.0
+    amplitude = 50.0
+
+    filtered = {"Time": t}
+    for name in skb_io.all_probe_names:
+        kind = skb_io.get_probe_type(name)
+        if kind in ("WG", "Mo"):
+            lag = 0.3 * int(name[2:])
+            x = amplitude * np.sin(2 * np.pi * (t - lag) / period)
+        elif kind == "WM":
+            x = 0.5 * amplitude * np.sin(2 * np.pi * t / period)
+        elif kind == "PS":
+            tImpact = np.arange(period / 2, duration, period) + 0.01 * int(name[2:])
+            x = np.zeros_like(t)
+            for ti in tImpact:
+                i0 = int(ti * fs)
+                x[i0:i0 + 200] += 1e3 * np.exp(-np.arange(len(x[i0:i0 + 200])) / 20)
+        elif name == "LED-chan100":
+            x = ((t > 5.0) & (t < 5.5)) | ((t > duration - 5.0) & (t < duration - 4.5))
+            x = x.astype(np.float64)
+        else:
+            x = np.zeros_like(t)
+        filtered.update({name: x + 0.5 * rng.normal(size=t.size)})
+
+    raw = {k: (v if k == "Time" else np.round(v * 100)) for k, v in filtered.items()}
+    voltage = {k: (v if k == "Time" else v * 1e-3) for k, v in filtered.items()}
+    default = dict(filtered)
+    default.update({"reference": "MP3Filtered"})
+
+    test_properties = {
+        "airGapAtMPL": 0.05,
+        "calibrationFile": "Test_d1021_Calib",
+        "depthAtMPL": 0.567,
+        "depthAtWM": 0.6,
+        "focusingLocation": "None",
+        "fSampling": fs,
+        "repeatType": "original",
+        "testName": "Test999",
+        "testType": "wave",
+        "useTest": "yes",
+        "waveAmplitude": amplitude / 1000,
+        "wavePeriod": period,
+        "waveType": "regular",
+        "remarks": "synthetic case for benchmarks",
+    }
+
+    return {
+        "MP3Filtered": filtered,
+        "MP3RawValue": raw,
+        "MP3Voltage": voltage,
+        "DefaultData": default,
+        "TestProperties": test_properties,
+    }
+
+
+# ==============================================================================
+
+def get_case_file(duration=60.0, **write_options) -> Path:
+    """
+    Path of a synthetic v7.3 MAT file, written on the first call.
+
+    Args:
+    - duration: Length of the record in s.
+    - write_options: Passed to `io.save_hdf5_mat` (chunk_time, compression,
+        dtype, ...). They are part of the file name.
+
+    Returns:
+    - Path: The MAT file.
+    """
+
+    tag = "_".join(f"{k}-{v}" for k, v in sorted(write_options.items()))
+    path = case_dir / f"case_{duration:g}s{'_' + tag if tag else ''}.mat"
+    if not path.exists():
+        case_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.stem}.tmp.mat")
+        with contextlib.redirect_stdout(io.StringIO()):
+            skb_io.save_hdf5_mat(tmp, make_case(duration), **write_options)
+        tmp.replace(path)
+    return path
+
+
+# ==============================================================================
+
+def run(benchmarks, number=5):
+    """
+    Run asv style benchmark classes without asv.
+
+    `time_*` methods are timed with timeit, `peakmem_*` methods report the
+    peak of the memory traced by tracemalloc during one call and the code
+    returned by `timeraw_*` methods is timed in a new interpreter (best of
+    `number` runs). `track_*` methods report their return value. The output
+    of the benchmarked functions is hidden.
+    """
+
+    for cls in benchmarks:
+        params = getattr(cls, "params", [])
+        if params and not isinstance(params[0], (list, tuple)):
+            params = [params]
+        for p in itertools.product(*params):
+            bench = cls()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if hasattr(bench, "setup"):
+                    bench.setup(*p)
+            for name in dir(bench):
+                method = getattr(bench, name)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if name.startswith("time_"):
+                        t = timeit.timeit(lambda: method(*p), number=number)
+                        result = f"{t / number * 1e3:.3f} ms"
+                    elif name.startswith("peakmem_"):
+                        tracemalloc.start()
+                        method(*p)
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        result = f"{peak / 2**20:.1f} MiB"
+                    elif name.startswith("track_"):
+                        result = f"{method(*p)}"
+                    elif name.startswith("timeraw_"):
+                        t = min(_time_raw(method(*p)) for _ in range(number))
+                        result = f"{t * 1e3:.3f} ms"
+                    else:
+                        continue
+                print(f"{cls.__name__}.{name}{p}: {result}")
+
+
+def _time_raw(code: str) -> float:
+    """Seconds to run `code` in a new interpreter, without its startup."""
+
+    script = ("import time\n_t0 = time.perf_counter()\n" + code
+        + "\nprint(time.perf_counter() - _t0)")
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True,
+        text=True, check=True)
+    return float(out.stdout.split()[-1])
@@ -1,10 +1,36 @@
 """
 `skyboxdatapy` is a Python based analysis tools for SkyBox datasets.
 
+The submodules are imported on first use (PEP 562), so `import skyboxdatapy`
+is cheap and e.g. a worker that only uses `skyboxdatapy.spec` does not import
+h5py, hdf5storage or matplotlib.
 """
 
+import importlib
 
-from . import io
-from . import postprocess
-from . import spec
-from . import utils
+
+__all__ = [
+    "cache",
+    "calibration",
+    "campaign",
+    "catalog",
+    "convert",
+    "io",
+    "postprocess",
+    "preview",
+    "profiling",
+    "spec",
+    "stats",
+    "utils",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        # import_module also sets the attribute, so this runs once per module
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
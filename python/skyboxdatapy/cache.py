@@ -0,0 +1,240 @@
+"""On-disk cache of converted SkyBox cases.
+
+`io.load_case(..., cache=True)` stores the converted xarray Datasets of a
+case in an uncompressed Zarr store, so that loading the same case again only
+opens the store lazily instead of decoding the MAT file.
+
+Entries are keyed on the content hash of the source file and the load
+options. The content hash is only recomputed when the path, size or mtime of
+the source file changed. The total size of the cache is bounded, the least
+recently used entries are removed first.
+Requires the optional `zarr` dependency.
+"""
+
+import os
+import json
+import time
+import pickle
+import shutil
+import sqlite3
+import hashlib
+from pathlib import Path
+
+import xarray as xr
+
+
+# ==============================================================================
+
+# Default size bound of the cache in bytes
+default_max_bytes = 20 * 2**30
+
+
+# ==============================================================================
+
+def get_cache_dir() -> Path:
+    """
+    Default cache directory, inside the user cache directory.
+
+    Returns:
+    - Path of the cache directory.
+    """
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(cache_dir) / "skyboxdatapy" / "cases"
+
+
+# ==============================================================================
+
+def load_cached(file, loader, options: dict,
+    *, cache_dir=None, max_bytes=None) -> dict:
+    """
+    Load a case through the cache.
+
+    Args:
+    - file: Path to the source MAT file.
+    - loader: Function `loader(file) -> dict` used on a cache miss,
+        usually `io.load_case` without cache.
+    - options: Load options that change the result (probes, time window, ...).
+        They are part of the cache key.
+    - cache_dir: Cache directory.
+        - Default value: `get_cache_dir()`
+    - max_bytes: Size bound of the cache in bytes.
+        - Default value: `skyboxdatapy.cache.default_max_bytes`
+
+    Returns:
+    - dict: Same layout as `io.load_case`. On a cache hit the Datasets are
+        opened lazily from the Zarr store.
+    """
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    cache_dir = Path(cache_dir)
+    if max_bytes is None:
+        max_bytes = default_max_bytes
+
+    file = Path(file).resolve()
+    opt_key = hashlib.sha1(
+        json.dumps(options, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+
+    con = _connect(cache_dir)
+    try:
+        key = f"{_get_content_hash(con, file)}_{opt_key}"
+        entry = cache_dir / key
+
+        with con:
+            row = con.execute(
+                "SELECT key FROM entries WHERE key = ?", (key,)).fetchone()
+            if (row is not None) and entry.exists():
+                con.execute("UPDATE entries SET last_access = ? WHERE key = ?",
+                    (time.time(), key))
+                return _read_entry(entry)
+
+        data = loader(file)
+        nbytes = _write_entry(entry, data)
+
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO entries (key, nbytes, last_access) "
+                "VALUES (?, ?, ?)", (key, nbytes, time.time()))
+            _evict(con, cache_dir, max_bytes, keep=key)
+    finally:
+        con.close()
+
+    return data
+
+
+# ==============================================================================
+
+def clear_cache(cache_dir=None):
+    """
+    Remove all entries of the cache.
+
+    Args:
+    - cache_dir: Cache directory.
+        - Default value: `get_cache_dir()`
+    """
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# ==============================================================================
+
+def _connect(cache_dir: Path) -> sqlite3.Connection:
+    """Open the cache index, creating the tables if needed."""
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(cache_dir / "index.sqlite", timeout=30)
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS sources (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+            content_hash TEXT);
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, nbytes INTEGER, last_access REAL);
+    """)
+    return con
+
+
+def _get_content_hash(con: sqlite3.Connection, file: Path) -> str:
+    """Content hash of a file, reused while its size and mtime are unchanged."""
+
+    st = file.stat()
+    row = con.execute(
+        "SELECT content_hash FROM sources "
+        "WHERE path = ? AND size = ? AND mtime_ns = ?",
+        (str(file), st.st_size, st.st_mtime_ns)).fetchone()
+    if row is not None:
+        return row[0]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, "rb") as fid:
+        while block := fid.read(2**23):
+            h.update(block)
+    content_hash = h.hexdigest()
+
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO sources (path, size, mtime_ns, content_hash) "
+            "VALUES (?, ?, ?, ?)",
+            (str(file), st.st_size, st.st_mtime_ns, content_hash))
+    return content_hash
+
+
+def _write_entry(entry: Path, data: dict) -> int:
+    """Write a case to a cache entry and return its size in bytes.
+
+    Datasets go to an uncompressed Zarr store without attrs; the attrs and
+    all other entries are pickled, since they are not always JSON friendly.
+    """
+
+    import zarr
+
+    tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    # zarr 3 uses 'compressors', zarr 2 'compressor'
+    if int(zarr.__version__.split(".")[0]) >= 3:
+        no_compression = {"compressors": None}
+    else:
+        no_compression = {"compressor": None}
+
+    meta = {}
+    for l1key, l1val in data.items():
+        if isinstance(l1val, xr.Dataset):
+            ds = l1val.copy(deep=False)
+            ds.attrs = {}
+            ds.to_zarr(tmp / "data.zarr", group=l1key, mode="a",
+                consolidated=False,
+                encoding={v: no_compression for v in ds.variables})
+            meta.update({l1key: ("dataset", l1val.attrs)})
+        else:
+            meta.update({l1key: ("value", l1val)})
+
+    with open(tmp / "meta.pkl", "wb") as fid:
+        pickle.dump(meta, fid)
+
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # Written concurrently by another process
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+
+
+def _read_entry(entry: Path) -> dict:
+    """Open a cache entry, with the Datasets backed lazily by the Zarr store."""
+
+    with open(entry / "meta.pkl", "rb") as fid:
+        meta = pickle.load(fid)
+
+    data = {}
+    for l1key, (kind, val) in meta.items():
+        if kind == "dataset":
+            ds = xr.open_zarr(entry / "data.zarr", group=l1key,
+                chunks=None, consolidated=False)
+            ds.attrs.update(val)
+            data.update({l1key: ds})
+        else:
+            data.update({l1key: val})
+    return data
+
+
+def _evict(con: sqlite3.Connection, cache_dir: Path, max_bytes, keep):
+    """Remove least recently used entries until the cache fits in max_bytes."""
+
+    rows = con.execute(
+        "SELECT key, nbytes FROM entries ORDER BY last_access").fetchall()
+    total = sum(n for (_, n) in rows)
+
+    for key, nbytes in rows:
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(cache_dir / key, ignore_errors=True)
+        con.execute("DELETE FROM entries WHERE key = ?", (key,))
+        total -= nbytes
@@ -0,0 +1,315 @@
+"""Raw to physical conversion with the factors of a calibration test.
+
+A calibration test has a "ConversionFactor" and a "ConversionOffset" sheet
+with one value per probe. `get_calibration` parses them once and keeps them as
+a Dataset of `factor` and `offset` vectors along a `probe` dimension, cached
+in memory and on disk by calibration test name, so the XLSX file is not read
+again, also in later sessions. `apply_calibration` then converts all probes
+of a Dataset at once:
+
+    physical = factor * raw + offset
+
+    >>> cal = get_calibration("Test_d1021_Calib", "../data_nosync")
+    >>> ds = apply_calibration(case["MP3RawValue"], cal)
+    >>> ds.attrs["calibration"]
+    'Test_d1021_Calib'
+
+Converted MAT files also keep the sheets of their calibration test, which
+`calibration_from_case` reads, and `io.load_case(..., calibration=...)`
+applies a calibration when loading the case.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from . import cache as skb_cache
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+
+# Sheets of the factors and offsets in the calibration test and MAT files
+factor_sheet = "ConversionFactor"
+offset_sheet = "ConversionOffset"
+
+# Calibrations already parsed in this session, by name
+_calibrations = {}
+
+
+# ==============================================================================
+
+def get_calibration_dir() -> Path:
+    """
+    Default directory of the parsed calibrations, next to the case cache.
+
+    Returns:
+    - Path of the calibration directory.
+    """
+
+    return skb_cache.get_cache_dir().parent / "calibration"
+
+
+# ==============================================================================
+
+def get_calibration(name, root_dir=None, *, calib_file=None, catalog=False,
+    cache_dir=None) -> xr.Dataset:
+    """
+    Factor and offset vectors of a calibration test.
+
+    The calibration is looked up in memory, then in the calibration
+    directory, and only then parsed from the XLSX file of the test. A cached
+    calibration is parsed again when its XLSX file is given (or found) and
+    its size or mtime changed.
+
+    Args:
+    - name: Name of the calibration test, e.g. "Test_d1021_Calib".
+    - root_dir: Root directory searched for the XLSX file, see
+        `io.find_unique_file`. Not needed once the calibration is cached.
+        - Default value: None
+    - calib_file: XLSX file of the calibration test, instead of searching.
+        - Default value: None
+    - catalog: Passed to `io.find_unique_file`.
+        - Default value: False
+    - cache_dir: Directory of the parsed calibrations.
+        - Default value: `get_calibration_dir()`
+
+    Returns:
+    - xr.Dataset: `factor` and `offset` along `probe`, with the attrs `name`
+        and `source`.
+
+    Raises:
+    - ValueError: If the calibration is not cached and no XLSX file is found.
+    """
+
+    if cache_dir is None:
+        cache_dir = get_calibration_dir()
+    entry = Path(cache_dir) / f"{name}.json"
+
+    if (calib_file is None) and (root_dir is not None):
+        from . import io as skb_io
+        calib_file = skb_io.find_unique_file(root_dir, name, "xlsx",
+            catalog=catalog)
+
+    stamp = None
+    if calib_file is not None:
+        st = os.stat(calib_file)
+        stamp = [st.st_size, st.st_mtime_ns]
+
+    cal = _calibrations.get(name)
+    if (cal is not None) and (stamp is None or cal.attrs["stamp"] == stamp):
+        return cal
+
+    if entry.exists():
+        with open(entry) as fid:
+            saved = json.load(fid)
+        if stamp is None or saved["stamp"] == stamp:
+            cal = _make_calibration(saved["probes"], saved["factor"],
+                saved["offset"], name=name, source=saved["source"],
+                stamp=saved["stamp"])
+            _calibrations.update({name: cal})
+            return cal
+
+    if calib_file is None:
+        raise ValueError(f"Calibration {name} is not cached, give its "
+            "root_dir or calib_file")
+
+    from . import convert as skb_convert
+
+    logger.info("Processing Calibration file: %s", calib_file)
+    sheets = skb_convert.read_calibration(calib_file,
+        sheet_names=[factor_sheet, offset_sheet])
+    cal = calibration_from_sheets(sheets, name=name, source=str(calib_file))
+    cal.attrs["stamp"] = stamp
+
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as fid:
+        json.dump({"source": cal.attrs["source"], "stamp": stamp,
+            "probes": cal["probe"].values.tolist(),
+            "factor": cal["factor"].values.tolist(),
+            "offset": cal["offset"].values.tolist()}, fid)
+    os.replace(tmp, entry)
+
+    _calibrations.update({name: cal})
+    return cal
+
+
+# ==============================================================================
+
+def calibration_from_sheets(sheets: dict, name="", source="") -> xr.Dataset:
+    """
+    Calibration from the sheets returned by `convert.read_calibration`.
+
+    Probes without a numeric factor are left out. A missing offset is 0.
+
+    Args:
+    - sheets: {"ConversionFactor": {probe: value}, "ConversionOffset": {...}}.
+    - name: Name of the calibration test.
+    - source: File the sheets were read from.
+
+    Returns:
+    - xr.Dataset: `factor` and `offset` along `probe`, see `get_calibration`.
+    """
+
+    factors = sheets.get(factor_sheet, {})
+    offsets = sheets.get(offset_sheet, {})
+
+    probes, factor, offset = [], [], []
+    for probe, val in factors.items():
+        f = _to_float(val)
+        if not np.isfinite(f):
+            continue
+        o = _to_float(offsets.get(probe, 0.0))
+        probes.append(str(probe))
+        factor.append(f)
+        offset.append(o if np.isfinite(o) else 0.0)
+
+    return _make_calibration(probes, factor, offset, name=name, source=source)
+
+
+def calibration_from_case(case: dict, name=None) -> xr.Dataset:
+    """
+    Calibration stored in a converted case, e.g. from `io.load_case`.
+
+    Args:
+    - case: Loaded case with the "ConversionFactor" (and "ConversionOffset")
+        entries.
+    - name: Name of the calibration.
+        - Default value: TestProperties.calibrationFile of the case
+
+    Returns:
+    - xr.Dataset: `factor` and `offset` along `probe`, see `get_calibration`.
+
+    Raises:
+    - ValueError: If the case has no "ConversionFactor" entry.
+    """
+
+    if factor_sheet not in case:
+        raise ValueError(f"Case has no {factor_sheet} entry")
+    if name is None:
+        name = str(case.get("TestProperties", {}).get("calibrationFile", ""))
+    return calibration_from_sheets(case, name=name, source="case")
+
+
+# ==============================================================================
+
+def apply_calibration(dsIn: xr.Dataset, calibration: xr.Dataset,
+    probes=None) -> xr.Dataset:
+    """
+    Convert raw probe values to physical values, `factor * raw + offset`.
+
+    NumPy backed probes are converted together in one broadcast operation on
+    a (probe, Time) matrix; dask backed probes stay lazy. Float probes keep
+    their dtype (e.g. float32), integer probes become float64. Probes without
+    factor are not changed. The calibration name and the factors and offsets
+    used are recorded in `attrs`.
+
+    Args:
+    - dsIn: Dataset with one variable per probe, or the stacked layout of
+        `io.convert_dict_to_xarray`. Campaign Datasets (case, Time) work too.
+    - calibration: From `get_calibration` or `calibration_from_case`.
+    - probes: Probes to convert.
+        - Default value: all probes of the Dataset with a factor
+
+    Returns:
+    - xr.Dataset: New Dataset with the converted probes, the other variables
+        are shared with `dsIn`.
+
+    Raises:
+    - ValueError: If `dsIn` is already calibrated.
+    """
+
+    if "calibration" in dsIn.attrs:
+        raise ValueError(f"Dataset is already calibrated with "
+            f"{dsIn.attrs['calibration']}")
+
+    known = set(calibration["probe"].values.tolist())
+    stacked = "probes" in dsIn.data_vars and "probe" in dsIn["probes"].dims
+
+    if stacked:
+        names = dsIn["probe"].values.tolist()
+    else:
+        names = list(dsIn.data_vars)
+    if probes is None:
+        probes = [p for p in names if p in known]
+    else:
+        missing = [p for p in probes if p not in known]
+        if missing:
+            raise ValueError(f"No calibration for {missing}")
+
+    cal = calibration.sel(probe=probes)
+    factor = cal["factor"].values
+    offset = cal["offset"].values
+
+    dsOut = dsIn.copy(deep=False)
+    with skb_profiling.stage("calibration") as st:
+        if stacked:
+            dtype = _get_float_dtype(dsIn["probes"].dtype)
+            f = xr.DataArray(np.ones(len(names)), coords={"probe": names})
+            o = xr.DataArray(np.zeros(len(names)), coords={"probe": names})
+            f.loc[probes] = factor
+            o.loc[probes] = offset
+            dsOut["probes"] = dsIn["probes"] * f.astype(dtype) + o.astype(dtype)
+            dsOut["probes"].attrs = dict(dsIn["probes"].attrs)
+            st.nbytes += dsIn["probes"].nbytes
+        else:
+            eager = [p for p in probes if isinstance(dsIn[p].data, np.ndarray)]
+            if eager:
+                iEager = [probes.index(p) for p in eager]
+                shape = (-1,) + (1,) * dsIn[eager[0]].ndim
+                dtype = _get_float_dtype(np.result_type(*[dsIn[p].dtype for p in eager]))
+                data = np.stack([dsIn[p].values for p in eager]).astype(dtype, copy=False)
+                data *= factor[iEager].reshape(shape)
+                data += offset[iEager].reshape(shape)
+                for p, arr in zip(eager, data):
+                    dsOut[p] = dsIn[p].copy(data=arr)
+                st.nbytes += data.nbytes
+            for i, p in enumerate(probes):
+                if p not in eager:
+                    dtype = _get_float_dtype(dsIn[p].dtype)
+                    dsOut[p] = dsIn[p] * dtype.type(factor[i]) + dtype.type(offset[i])
+                    dsOut[p].attrs = dict(dsIn[p].attrs)
+
+    # Never share the dictionary with dsIn
+    dsOut.attrs = dict(dsIn.attrs)
+    dsOut.attrs["calibration"] = calibration.attrs.get("name", "")
+    dsOut.attrs["calibration_factors"] = dict(zip(probes, factor.tolist()))
+    dsOut.attrs["calibration_offsets"] = dict(zip(probes, offset.tolist()))
+
+    return dsOut
+
+
+# ==============================================================================
+
+def _make_calibration(probes, factor, offset, **attrs) -> xr.Dataset:
+    """Calibration Dataset from its vectors."""
+
+    return xr.Dataset(
+        {"factor": ("probe", np.asarray(factor, dtype=np.float64)),
+         "offset": ("probe", np.asarray(offset, dtype=np.float64))},
+        coords={"probe": list(probes)}, attrs=attrs)
+
+
+def _get_float_dtype(dtype) -> np.dtype:
+    """dtype of the calibrated values: float dtypes are kept."""
+
+    dtype = np.dtype(dtype)
+    return dtype if dtype.kind == 'f' else np.dtype(np.float64)
+
+
+def _to_float(val) -> float:
+    """Value of a calibration cell, NaN if it is not a number."""
+
+    try:
+        # MAT files give (1, 1) arrays
+        return float(np.asarray(val, dtype=np.float64).reshape(-1)[0])
+    except (TypeError, ValueError, IndexError):
+        return np.nan
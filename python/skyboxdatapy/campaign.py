@@ -0,0 +1,227 @@
+"""Campaign store: many SkyBox cases stacked along a `case` dimension.
+
+`build_campaign` reads the time series group (DefaultData by default) of many
+MAT files and appends them, one case at a time, to a chunked Zarr store with
+dimensions (case, Time). The scalar TestProperties of each case (waveType,
+wavePeriod, depthAtMPL, ...) become coordinates along `case`, so comparing
+conditions is an indexed selection on one store:
+
+    >>> ds = open_campaign("campaign.zarr")
+    >>> select_cases(ds, waveType="regular", wavePeriod=1.0)["WG01"]
+
+Running `build_campaign` again with more files only appends the new cases.
+All cases share the Time coordinate `arange(n) / fSampling`. Shorter cases
+are padded with NaN (`nSamples` holds the valid length), longer cases are cut.
+Requires the optional `zarr` dependency.
+"""
+
+import logging
+import numbers
+import warnings
+from pathlib import Path
+
+import h5py
+import numpy as np
+import xarray as xr
+
+from . import io as skb_io
+from . import postprocess as skb_postprocess
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+
+def build_campaign(store, files, *, names=None, group="DefaultData",
+    probes=None, properties=None, fSampling=2000.0, duration=None,
+    chunk_time=2**16, dtype=np.float64) -> list:
+    """
+    Create a campaign store or append new cases to it.
+
+    The layout of the store (probes, properties, fSampling and duration) is
+    fixed when it is created; later calls only append the cases whose name
+    is not in the store yet.
+
+    Args:
+    - store: Path of the Zarr store.
+    - files: MAT files of the cases, e.g. `sorted(Path(root).rglob("Test*.mat"))`.
+    - names: Case names, in the order of `files`.
+        - Default value: the file stems, e.g. "Test171"
+    - group: Time series group to stack.
+        - Default value: "DefaultData"
+    - probes: Probes to store.
+        - Default value: the probes of the first case
+    - properties: TestProperties keys stored as case coordinates. Cases
+        without a key (or without TestProperties) get "" or NaN.
+        - Default value: the scalar TestProperties of the first case
+    - fSampling: Sampling frequency of the store in Hz. Cases with another
+        `TestProperties.fSampling` are resampled with `postprocess.resample_to`.
+        - Default value: 2000
+    - duration: Length of the Time dimension in s.
+        - Default value: the length of the first case
+    - chunk_time: Samples per Zarr chunk along Time (chunks hold one case).
+        - Default value: 2**16
+    - dtype: Storage dtype of the probes.
+        - Default value: float64
+
+    Returns:
+    - list: Names of the appended cases.
+    """
+
+    store = Path(store)
+    files = [Path(f) for f in files]
+    if names is None:
+        names = [f.stem for f in files]
+
+    layout = _read_layout(store)
+    done = set() if layout is None else set(layout["names"])
+
+    added = []
+    for file, name in zip(files, names):
+        if name in done:
+            continue
+
+        # Cases without TestProperties are stored with empty properties
+        with h5py.File(file, "r") as h5:
+            groups = [group] + (["TestProperties"] if "TestProperties" in h5 else [])
+        case = skb_io.load_case(file, groups=groups,
+            probes=probes if layout is None else layout["probes"])
+        test_properties = case.get("TestProperties", {})
+        ds = case[group]
+
+        if layout is None:
+            if probes is None:
+                probes = list(ds.data_vars)
+            if properties is None:
+                properties = [k for k, v in test_properties.items()
+                    if isinstance(v, (str, numbers.Number))]
+            n_time = ds.sizes["Time"] if duration is None \
+                else int(round(duration * fSampling))
+            layout = {"probes": probes, "n_time": n_time,
+                "fSampling": fSampling, "properties": {
+                    k: isinstance(test_properties.get(k), str)
+                    for k in properties}}
+
+        dsCase = _get_case_dataset(ds, test_properties, name, layout, dtype)
+
+        if not done:
+            encoding = {p: {"chunks": (1, chunk_time)} for p in layout["probes"]}
+            dsCase.to_zarr(store, mode="w", consolidated=False,
+                encoding=encoding)
+        else:
+            dsCase.drop_vars("Time").to_zarr(store, append_dim="case",
+                consolidated=False)
+
+        done.add(name)
+        added.append(name)
+        logger.info("Added %s to %s", name, store)
+
+    return added
+
+
+# ==============================================================================
+
+def open_campaign(store, chunks=None) -> xr.Dataset:
+    """
+    Open a campaign store lazily.
+
+    The case coordinates are loaded, so selections on them are immediate;
+    the probe data is only read when needed.
+
+    Args:
+    - store: Path of the Zarr store.
+    - chunks: Dask chunks, e.g. {} for the chunks of the store.
+        - Default value: None, lazy arrays without dask
+
+    Returns:
+    - xr.Dataset: Probes with dimensions (case, Time) and the TestProperties
+        as coordinates along `case`.
+    """
+
+    ds = xr.open_zarr(store, chunks=chunks, consolidated=False)
+    coords = [c for c in ds.coords if ds[c].dims == ("case",)]
+    return ds.assign_coords({c: ds[c].load() for c in coords})
+
+
+# ==============================================================================
+
+def select_cases(ds: xr.Dataset, **properties) -> xr.Dataset:
+    """
+    Select the cases whose coordinates equal the given values.
+
+    Args:
+    - ds: Campaign Dataset from `open_campaign`.
+    - properties: Coordinate values, e.g. waveType="regular", wavePeriod=1.0.
+        A list selects any of its values.
+
+    Returns:
+    - xr.Dataset: The matching cases.
+
+    Examples:
+
+        >>> select_cases(ds, waveType="regular", wavePeriod=[1.0, 1.5])["WG01"]
+    """
+
+    mask = np.ones(ds.sizes["case"], dtype=bool)
+    for key, val in properties.items():
+        mask &= np.isin(ds[key].values, np.atleast_1d(val))
+    return ds.isel(case=np.flatnonzero(mask))
+
+
+# ==============================================================================
+
+def _read_layout(store: Path):
+    """Layout of an existing store, None if the store does not exist."""
+
+    if not store.exists():
+        return None
+
+    ds = open_campaign(store)
+    return {"names": ds["case"].values.tolist(),
+        "probes": list(ds.data_vars),
+        "n_time": ds.sizes["Time"],
+        "fSampling": ds.attrs["fSampling"],
+        "properties": {c: ds[c].dtype.kind in "OUT" for c in ds.coords
+            if ds[c].dims == ("case",) and c not in ("case", "t0", "nSamples")}}
+
+
+def _get_case_dataset(ds: xr.Dataset, test_properties: dict, name: str,
+    layout: dict, dtype) -> xr.Dataset:
+    """One case on the Time grid of the store, with dimensions (case, Time)."""
+
+    fSampling = layout["fSampling"]
+    n_time = layout["n_time"]
+
+    fCase = float(test_properties.get("fSampling", fSampling))
+    if not np.isclose(fCase, fSampling):
+        ds = skb_postprocess.resample_to(ds, fSampling, fCase)
+
+    n = min(ds.sizes["Time"], n_time)
+    if ds.sizes["Time"] > n_time:
+        warnings.warn(f"{name} is cut from {ds.sizes['Time']} to {n_time} samples")
+
+    data_vars = {}
+    for p in layout["probes"]:
+        arr = np.full((1, n_time), np.nan, dtype=dtype)
+        if p in ds:
+            arr[0, :n] = ds[p].values[:n]
+        data_vars.update({p: (("case", "Time"), arr)})
+
+    coords = {
+        "case": np.array([name], dtype=object),
+        "Time": np.arange(n_time) / fSampling,
+        "t0": ("case", [float(ds["Time"].values[0])]),
+        "nSamples": ("case", [n]) }
+    for key, is_str in layout["properties"].items():
+        val = test_properties.get(key, "" if is_str else np.nan)
+        if is_str:
+            val = np.array([str(val)], dtype=object)
+        else:
+            try:
+                val = [float(val)]
+            except (TypeError, ValueError):
+                val = [np.nan]
+        coords.update({key: ("case", val)})
+
+    return xr.Dataset(data_vars, coords=coords, attrs={"fSampling": fSampling})
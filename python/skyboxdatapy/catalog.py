@@ -0,0 +1,189 @@
+"""Persistent file catalog for SkyBox data trees.
+
+The catalog is a small SQLite database with one row per directory and one
+row per file, indexed on the file name. It is built once per root directory
+and updated incrementally: a directory is only listed again if its mtime
+changed, otherwise its known sub-directories are visited directly.
+File name queries then use the index instead of walking the tree.
+"""
+
+import os
+import time
+import fnmatch
+import hashlib
+import sqlite3
+from pathlib import Path
+
+
+# ==============================================================================
+
+# Directories modified less than this many seconds ago are re-listed on the
+# next update, since a second change within the mtime resolution would be missed
+_mtime_guard_s = 2.0
+
+
+# ==============================================================================
+
+def get_catalog_path(root_dir: str) -> Path:
+    """
+    Default location of the catalog for a root directory.
+
+    The catalog is kept in the user cache directory and not inside the data
+    tree, which is often read-only or shared.
+
+    Args:
+    - root_dir: Root directory of the data tree.
+
+    Returns:
+    - Path of the SQLite catalog file.
+    """
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    key = hashlib.sha1(str(Path(root_dir).resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir) / "skyboxdatapy" / f"catalog_{key}.sqlite"
+
+
+# ==============================================================================
+
+def update_catalog(root_dir: str, catalog_path=None) -> Path:
+    """
+    Create or incrementally update the file catalog of a directory tree.
+
+    Args:
+    - root_dir: Root directory of the data tree.
+    - catalog_path: Path of the SQLite catalog file.
+        - Default value: `get_catalog_path(root_dir)`
+
+    Returns:
+    - Path of the SQLite catalog file.
+    """
+
+    root = Path(root_dir)
+    if catalog_path is None:
+        catalog_path = get_catalog_path(root_dir)
+    catalog_path = Path(catalog_path)
+
+    con = _connect(catalog_path)
+    try:
+        with con:
+            known = dict(con.execute("SELECT path, mtime_ns FROM dirs"))
+            now_ns = time.time_ns()
+            seen = set()
+            stack = [""]
+
+            while stack:
+                rel = stack.pop()
+                try:
+                    mtime_ns = os.stat(root / rel).st_mtime_ns
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                seen.add(rel)
+
+                if known.get(rel) == mtime_ns:
+                    stack.extend(r for (r,) in con.execute(
+                        "SELECT path FROM dirs WHERE parent = ?", (rel,)))
+                    continue
+
+                files = []
+                for entry in os.scandir(root / rel):
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(child)
+                    elif entry.is_file():
+                        files.append((entry.name, rel))
+
+                if now_ns - mtime_ns < _mtime_guard_s * 1e9:
+                    mtime_ns = -1
+
+                con.execute("DELETE FROM files WHERE dir = ?", (rel,))
+                con.executemany(
+                    "INSERT INTO files (name, dir) VALUES (?, ?)", files)
+                con.execute(
+                    "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) "
+                    "VALUES (?, ?, ?)", (rel, _get_parent(rel), mtime_ns))
+
+            removed = [(r,) for r in known if r not in seen]
+            con.executemany("DELETE FROM dirs WHERE path = ?", removed)
+            con.executemany("DELETE FROM files WHERE dir = ?", removed)
+    finally:
+        con.close()
+
+    return catalog_path
+
+
+# ==============================================================================
+
+def query_catalog(root_dir: str, pattern: str, catalog_path=None) -> list:
+    """
+    Find files in the catalog whose name matches a glob pattern.
+
+    The literal prefix of the pattern (up to the first `*`, `?` or `[`) is
+    looked up with the file name index, so a query costs O(log n) plus
+    the number of files sharing that prefix.
+
+    Args:
+    - root_dir: Root directory of the data tree.
+    - pattern: Glob pattern on the file name, e.g. "Test171*.mat".
+    - catalog_path: Path of the SQLite catalog file.
+        - Default value: `get_catalog_path(root_dir)`
+
+    Returns:
+    - Sorted list of paths, joined to `root_dir` like `Path.rglob` does.
+        Files deleted since the last `update_catalog` are left out.
+
+    Examples:
+
+        >>> query_catalog("/data", "Test17*.mat")
+        ['/data/d1008/Measure_MAT/Test170.mat', '/data/d1008/Measure_MAT/Test171.mat']
+    """
+
+    if catalog_path is None:
+        catalog_path = get_catalog_path(root_dir)
+
+    prefix = pattern
+    for c in "*?[":
+        prefix = prefix.split(c, 1)[0]
+
+    con = _connect(Path(catalog_path))
+    try:
+        if prefix:
+            rows = con.execute(
+                "SELECT name, dir FROM files WHERE name >= ? AND name < ?",
+                (prefix, prefix + "\U0010ffff")).fetchall()
+        else:
+            rows = con.execute("SELECT name, dir FROM files").fetchall()
+    finally:
+        con.close()
+
+    root = Path(root_dir)
+    files = [str(root / d / n) for (n, d) in rows
+        if fnmatch.fnmatchcase(n, pattern)]
+    files = [f for f in files if os.path.isfile(f)]
+
+    return sorted(files)
+
+
+# ==============================================================================
+
+def _connect(catalog_path: Path) -> sqlite3.Connection:
+    """Open the catalog, creating the tables if needed."""
+
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(catalog_path, timeout=30)
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+        CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+        CREATE TABLE IF NOT EXISTS files (
+            name TEXT, dir TEXT, PRIMARY KEY (dir, name));
+        CREATE INDEX IF NOT EXISTS files_name ON files (name);
+    """)
+    return con
+
+
+def _get_parent(rel: str):
+    """Parent of a catalog directory, None for the root."""
+
+    if rel == "":
+        return None
+    return rel.rsplit("/", 1)[0] if "/" in rel else ""
@@ -0,0 +1,746 @@
+"""Conversion of SkyBox measurement files (CSV/XLSX) to HDF5 MATLAB files.
+
+Package version of the `scripts/convertFiles` notebooks. The measurement is
+read in blocks of rows and appended to resizable HDF5 datasets, so the memory
+use does not grow with the length of the recording.
+
+The module is also available as the `skybox-convert` command:
+
+    skybox-convert Test171.csv --fsampling 2000 --calibration Test_d1021_Calib.xlsx
+
+and a whole test log is converted in parallel with `skybox-convert-batch`:
+
+    skybox-convert-batch Test_log_PLT.xlsx ../data_nosync --calibration Test_d1021_Calib
+"""
+
+import os
+import time
+import logging
+import argparse
+import numbers
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from . import io as skb_io
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+
+# CSV export: column 3 is Time, each probe has 3 consecutive columns
+# (Filtered, RawValue, Voltage) starting at the columns below
+csv_time_column = 3
+csv_probe_columns = [
+    5, 8, 11, 14, 17, 20, 23, 26, 29, 32, 35,
+    38, 41, 44, 47, 50, 53, 56, 59, 62, 65, 68 ]
+csv_groups = {
+    "MP3Filtered": 0,
+    "MP3RawValue": 1,
+    "MP3Voltage": 2 }
+
+# XLSX export: one sheet per group
+xlsx_groups = {
+    "MP3Filtered": "Filtered",
+    "MP3RawValue": "RawValue",
+    "MP3Voltage": "Voltage" }
+xlsx_drop_columns = ['Index', 'Date-Time', 'Counter']
+
+calib_sheet_names = ["ConversionFactor", "ConversionOffset"]
+
+
+# ==============================================================================
+
+def convert_csv_to_mat(csv_file, mat_file=None,
+    *, test_properties=None, calibration=None, default_data="MP3Filtered",
+    chunksize=100_000, time_column=csv_time_column,
+    probe_columns=csv_probe_columns, groups=csv_groups, **write_options) -> str:
+    """
+    Convert a CSV measurement file to an HDF5 MAT file, block by block.
+
+    Parameters
+    ----------
+    - csv_file : str or Path
+        - CSV file exported by the acquisition software.
+    - mat_file : str or Path, optional
+        - Output file. Default is the CSV path with 'Measure_XLS' replaced
+        by 'Measure_MAT' and the '.mat' extension.
+    - test_properties : dict, optional
+        - Stored as 'TestProperties', see `get_test_properties`.
+    - calibration : dict, optional
+        - Calibration sheets stored as-is, see `read_calibration`.
+    - default_data : str, optional
+        - Group copied to 'DefaultData'. Default is 'MP3Filtered'.
+    - chunksize : int, optional
+        - Number of rows read at once. Default is 100 000.
+    - time_column : int, optional
+        - Index of the Time column.
+    - probe_columns : list of int, optional
+        - Index of the first column of each probe. The column names are
+        used as probe names for all groups.
+    - groups : dict, optional
+        - Group name -> column offset from the probe columns.
+    - write_options
+        - `chunk_time`, `compression`, `compression_opts`, `shuffle` and
+        `dtype`, as in `io.save_hdf5_mat`.
+
+    Returns
+    -------
+    - str
+        - Path of the MAT file.
+    """
+
+    if mat_file is None:
+        mat_file = _get_mat_file(csv_file)
+
+    header = pd.read_csv(csv_file, nrows=0).columns
+    probe_names = [header[c] for c in probe_columns]
+
+    fields = {g: ["Time"] + probe_names for g in groups}
+    usecols = sorted({time_column} |
+        {c + offset for c in probe_columns for offset in groups.values()})
+
+    def blocks():
+        reader = pd.read_csv(csv_file, delimiter=',',
+            usecols=usecols, chunksize=chunksize)
+        for df in reader:
+            block = {}
+            for g, offset in groups.items():
+                inner = {"Time": df[header[time_column]].to_numpy(np.float64)}
+                for c, name in zip(probe_columns, probe_names):
+                    inner[name] = df[header[c + offset]].to_numpy(np.float64)
+                block[g] = inner
+            yield block
+
+    write_streamed_mat(mat_file, fields, blocks(),
+        default_data=default_data,
+        extra=_get_extra(test_properties, calibration), **write_options)
+
+    return str(mat_file)
+
+
+# ==============================================================================
+
+def convert_xlsx_to_mat(xlsx_file, mat_file=None,
+    *, test_properties=None, calibration=None, default_data="MP3Filtered",
+    chunksize=100_000, sheets=xlsx_groups,
+    drop_columns=xlsx_drop_columns, **write_options) -> str:
+    """
+    Convert an XLSX measurement file to an HDF5 MAT file, block by block.
+
+    The sheets are read row by row with openpyxl in read-only mode.
+
+    Parameters
+    ----------
+    - xlsx_file : str or Path
+        - XLSX file exported by the acquisition software.
+    - mat_file : str or Path, optional
+        - Output file. Default is the XLSX path with 'Measure_XLS' replaced
+        by 'Measure_MAT' and the '.mat' extension.
+    - test_properties : dict, optional
+        - Stored as 'TestProperties', see `get_test_properties`.
+    - calibration : dict, optional
+        - Calibration sheets stored as-is, see `read_calibration`.
+    - default_data : str, optional
+        - Group copied to 'DefaultData'. Default is 'MP3Filtered'.
+    - chunksize : int, optional
+        - Number of rows read at once. Default is 100 000.
+    - sheets : dict, optional
+        - Group name -> sheet name. Sheets missing in the file are skipped.
+    - drop_columns : list of str, optional
+        - Columns not stored.
+    - write_options
+        - `chunk_time`, `compression`, `compression_opts`, `shuffle` and
+        `dtype`, as in `io.save_hdf5_mat`.
+
+    Returns
+    -------
+    - str
+        - Path of the MAT file.
+    """
+
+    import openpyxl
+
+    if mat_file is None:
+        mat_file = _get_mat_file(xlsx_file)
+
+    wb = openpyxl.load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        sheets = {g: s for g, s in sheets.items() if s in wb.sheetnames}
+
+        fields = {}
+        for g, s in sheets.items():
+            header = next(wb[s].iter_rows(max_row=1, values_only=True))
+            fields[g] = [str(h) for h in header
+                if (h is not None) and (h not in drop_columns)]
+
+        def blocks():
+            for g, s in sheets.items():
+                rows = wb[s].iter_rows(values_only=True)
+                header = next(rows)
+                keep = [i for i, h in enumerate(header)
+                    if (h is not None) and (h not in drop_columns)]
+
+                buffer = []
+                for row in rows:
+                    buffer.append([row[i] for i in keep])
+                    if len(buffer) == chunksize:
+                        yield _get_xlsx_block(g, fields[g], buffer)
+                        buffer = []
+                if buffer:
+                    yield _get_xlsx_block(g, fields[g], buffer)
+
+        write_streamed_mat(mat_file, fields, blocks(),
+            default_data=default_data,
+            extra=_get_extra(test_properties, calibration), **write_options)
+    finally:
+        wb.close()
+
+    return str(mat_file)
+
+
+# ==============================================================================
+
+def write_streamed_mat(mat_file, fields: dict, blocks,
+    *, default_data="MP3Filtered", extra=None,
+    chunk_time=None, compression=None, compression_opts=None,
+    shuffle=True, dtype=None):
+    """
+    Write an HDF5 MAT file from blocks of time series.
+
+    The MATLAB struct layout is first written by `io.save_hdf5_mat` with
+    placeholders, which are then replaced by resizable datasets and filled
+    block by block. Everything is written to a temporary file next to
+    `mat_file`, which replaces `mat_file` only once all blocks are written,
+    so a failed or interrupted conversion never leaves a truncated file.
+
+    Parameters
+    ----------
+    - mat_file : str or Path
+        - Output file.
+    - fields : dict
+        - Group name -> list of fields, including 'Time'.
+    - blocks : iterable of dict
+        - Each block is {group: {field: 1D array}} with consecutive samples.
+        A block does not need to contain all groups.
+    - default_data : str, optional
+        - Group copied to 'DefaultData', with its name in 'reference'.
+    - extra : dict, optional
+        - Other top-level entries (TestProperties, calibration, ...).
+    - chunk_time, compression, compression_opts, shuffle, dtype
+        - Storage options, as in `io.save_hdf5_mat`.
+    """
+
+    mat_file = Path(mat_file)
+    mat_file.parent.mkdir(parents=True, exist_ok=True)
+    # hdf5storage appends '.mat' to other suffixes
+    tmp = mat_file.with_name(f".{mat_file.stem}.{os.getpid()}.tmp.mat")
+
+    try:
+        nrows = _write_streamed_mat(tmp, fields, blocks,
+            default_data=default_data, extra=extra, chunk_time=chunk_time,
+            compression=compression, compression_opts=compression_opts,
+            shuffle=shuffle, dtype=dtype)
+        os.replace(tmp, mat_file)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+    logger.info("Wrote %d samples to %s", nrows, mat_file)
+
+
+def _write_streamed_mat(mat_file, fields, blocks, *, default_data, extra,
+    chunk_time, compression, compression_opts, shuffle, dtype) -> int:
+    """Body of `write_streamed_mat`, returns the number of samples."""
+
+    fields = dict(fields)
+    if default_data in fields:
+        fields["DefaultData"] = fields[default_data]
+
+    skeleton = {g: {f: np.float64(0) for f in names}
+        for g, names in fields.items()}
+    if "DefaultData" in skeleton:
+        skeleton["DefaultData"].update({"reference": default_data})
+    skeleton.update(extra or {})
+
+    skb_io.save_hdf5_mat(mat_file, skeleton)
+
+    with h5py.File(mat_file, "r+") as h5:
+        dsets = {}
+        for g, names in fields.items():
+            for f in names:
+                if (f == "Time") or (dtype is None):
+                    empty = np.empty(0, dtype=np.float64)
+                else:
+                    empty = np.empty(0, dtype=dtype)
+                dsets[(g, f)] = skb_io._replace_placeholder(h5[g], f, empty,
+                    chunk_time=chunk_time, compression=compression,
+                    compression_opts=compression_opts, shuffle=shuffle,
+                    resizable=True)
+
+        nrows = 0
+        blocks = iter(blocks)
+        while True:
+            with skb_profiling.stage("block_read"):
+                block = next(blocks, None)
+            if block is None:
+                break
+
+            with skb_profiling.stage("hdf5_write") as st:
+                for g, inner in block.items():
+                    targets = [g, "DefaultData"] if g == default_data else [g]
+                    for f, arr in inner.items():
+                        for t in targets:
+                            skb_io._append_series(dsets[(t, f)],
+                                arr.astype(dsets[(t, f)].dtype, copy=False))
+                            st.nbytes += arr.nbytes
+                    if g == default_data:
+                        nrows += len(inner["Time"])
+
+    return nrows
+
+
+# ==============================================================================
+
+def read_calibration(calib_file, sheet_names=calib_sheet_names) -> dict:
+    """
+    Read the calibration sheets of a calibration test.
+
+    Parameters
+    ----------
+    - calib_file : str or Path
+        - XLSX file of the calibration test.
+    - sheet_names : list of str, optional
+        - Sheets to read. Default is ["ConversionFactor", "ConversionOffset"].
+
+    Returns
+    -------
+    - dict
+        - Sheet name -> {probe: value}, from the first row of each sheet.
+    """
+
+    sheets = {}
+
+    for sheet_name in sheet_names:
+        df = pd.read_excel(calib_file, sheet_name=sheet_name, nrows=5)
+        df = df.drop(
+            columns=['Index','Date-Time','Time','Counter','LED-chan100'],
+            errors='ignore'
+        )
+
+        inner = {}
+        for col in df.columns:
+            arr = df[col][0] # Taking only first row
+            if isinstance(arr, (np.integer, int)):
+                arr = np.float64(arr)
+            inner[col] = arr
+        sheets[sheet_name] = inner
+
+    return sheets
+
+
+# ==============================================================================
+
+def get_test_properties(dfListRow, fSampling, calibTestName=None) -> dict:
+    """
+    TestProperties of a case from its row in the test log spreadsheet.
+
+    Parameters
+    ----------
+    - dfListRow : pandas.Series
+        - Row of the test log (columns C2, C3, ...).
+    - fSampling : float
+        - Sampling frequency in Hz.
+    - calibTestName : str, optional
+        - Name of the calibration test.
+
+    Returns
+    -------
+    - dict
+        - Test properties, lengths in meters and periods in seconds.
+    """
+
+    return {
+        'airGapAtMPL': dfListRow['C12']/1000,  # meters
+        'calibrationFile': calibTestName if calibTestName else 'None',
+        'depthAtMPL': (dfListRow['C7']-33)/1000,    # meters
+        'depthAtWM': dfListRow['C7']/1000,    # meters
+        'focusingLocation': dfListRow['C11'],
+        'fSampling': fSampling,              # Hz
+        'repeatType': dfListRow['C4'],
+        'testName': dfListRow['C2'],
+        'testType': dfListRow['C3'],
+        'useTest': dfListRow['C6'],
+        'waveAmplitude': dfListRow['C9']/1000, # meters
+        'wavePeriod': float(dfListRow['C10']) if isinstance(dfListRow['C10'], numbers.Number) else dfListRow['C10'],  # seconds
+        'waveType': dfListRow['C8'],
+        'remarks': dfListRow['C16']
+    }
+
+
+# ==============================================================================
+
+def process_skybox_case(dfListRow, fSampling, root_dir,
+    *, calibTestName=None, ext="csv", catalog=False, **kwargs) -> str:
+    """
+    Convert one case of the test log to a MAT file.
+
+    Parameters
+    ----------
+    - dfListRow : pandas.Series
+        - Row of the test log, the test name is in column C2.
+    - fSampling : float
+        - Sampling frequency in Hz.
+    - root_dir : str
+        - Root of the data tree with the Measure_XLS folders.
+    - calibTestName : str, optional
+        - Name of the calibration test, read from its XLSX file.
+    - ext : str, optional
+        - Measurement file type, "csv" or "xlsx". Default is "csv".
+    - catalog : bool, optional
+        - Use the file catalog to find the files, see `io.find_unique_file`.
+    - kwargs
+        - Passed to `convert_csv_to_mat` / `convert_xlsx_to_mat`.
+
+    Returns
+    -------
+    - str
+        - Path of the MAT file.
+    """
+
+    calibration = None
+    if calibTestName:
+        calibFile = skb_io.find_unique_file(root_dir, calibTestName, "xlsx",
+            catalog=catalog)
+        logger.info("Processing Calibration file: %s", calibFile)
+        calibration = read_calibration(calibFile)
+
+    caseFile = skb_io.find_unique_file(root_dir, dfListRow['C2'], ext,
+        catalog=catalog)
+    logger.info("Processing Case file: %s", caseFile)
+
+    return convert_file(caseFile,
+        test_properties=get_test_properties(dfListRow, fSampling, calibTestName),
+        calibration=calibration, **kwargs)
+
+
+# ==============================================================================
+
+def convert_test_log(test_log, root_dir,
+    *, calibTestName=None, fSampling=2000.0, ext="csv", rows=None,
+    query=None, max_workers=None, report_file=None, force=False,
+    **kwargs) -> pd.DataFrame:
+    """
+    Convert the cases of a test log spreadsheet in parallel.
+
+    Each case is converted in a separate process. Cases whose MAT file is 
+    newer than the measurement file are skipped, so an interrupted run can 
+    be restarted and only converts what is missing or failed. The MAT files
+    are only written once complete (see `write_streamed_mat`), and cases 
+    marked failed in an existing report are converted again.
+    The report is written after every case.
+
+    Parameters
+    ----------
+    - test_log : str or Path
+        - Test log spreadsheet, e.g. Test_log_PLT.xlsx.
+    - root_dir : str
+        - Root of the data tree with the Measure_XLS folders.
+    - calibTestName : str, optional
+        - Name of the calibration test. Read once for all cases.
+    - fSampling : float, optional
+        - Sampling frequency in Hz. Default is 2000.
+    - ext : str, optional
+        - Measurement file type, "csv" or "xlsx". Default is "csv".
+    - rows : list of int, optional
+        - Positional rows of the test log to convert. Default is all rows.
+    - query : str, optional
+        - `pandas.DataFrame.query` filter on the test log, e.g. "C8 == 'regular'".
+    - max_workers : int, optional
+        - Number of processes. Default is the number of cores.
+    - report_file : str or Path, optional
+        - CSV report. Default is '<test_log>_convert_report.csv'.
+    - force : bool, optional
+        - Convert also the cases that are up to date. Default is False.
+    - kwargs
+        - Passed to `convert_csv_to_mat` / `convert_xlsx_to_mat`.
+
+    Returns
+    -------
+    - pandas.DataFrame
+        - Report with testName, source, mat_file, status 
+        ('done', 'skipped' or 'failed'), seconds and error per case.
+        The time per stage, summed over the converted cases, is in 
+        `report.attrs['stages']` (see `skyboxdatapy.profiling`).
+    """
+
+    dfList = pd.read_excel(test_log)
+    if rows is not None:
+        dfList = dfList.iloc[list(rows)]
+    if query is not None:
+        dfList = dfList.query(query)
+
+    if report_file is None:
+        report_file = Path(test_log).with_name(
+            Path(test_log).stem + "_convert_report.csv")
+
+    calibration = None
+    if calibTestName:
+        calibFile = skb_io.find_unique_file(root_dir, calibTestName, "xlsx",
+            catalog=True)
+        calibration = read_calibration(calibFile)
+
+    failed_before = set()
+    if Path(report_file).exists():
+        previous = pd.read_csv(report_file)
+        failed_before = set(
+            previous.loc[previous["status"] == "failed", "testName"].astype(str))
+
+    report = []
+    jobs = []
+    for _, dfListRow in dfList.iterrows():
+        entry = {"testName": dfListRow['C2'], "source": None, 
+            "mat_file": None, "status": None, "seconds": 0.0, "error": ""}
+        report.append(entry)
+        try:
+            caseFile = skb_io.find_unique_file(root_dir, dfListRow['C2'], ext,
+                catalog=True)
+        except ValueError as e:
+            entry.update({"status": "failed", "error": str(e)})
+            continue
+
+        mat_file = _get_mat_file(caseFile)
+        entry.update({"source": caseFile, "mat_file": str(mat_file)})
+
+        if (not force) and mat_file.exists() and \
+                (str(dfListRow['C2']) not in failed_before) and \
+                (os.path.getmtime(mat_file) > os.path.getmtime(caseFile)):
+            entry.update({"status": "skipped"})
+            continue
+
+        test_properties = get_test_properties(dfListRow, fSampling, calibTestName)
+        jobs.append((entry, (caseFile, test_properties, calibration, kwargs)))
+
+    _write_report(report, report_file)
+    logger.info("Converting %d of %d cases", len(jobs), len(report))
+    stages = skb_profiling.Report()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_convert_case, *args): entry
+            for entry, args in jobs}
+
+        for i, future in enumerate(as_completed(futures)):
+            entry = futures[future]
+            status, seconds, error, case_stages = future.result()
+            entry.update({"status": status, "seconds": seconds, "error": error})
+            stages.merge(case_stages)
+            _write_report(report, report_file)
+            logger.info("[%d/%d] %s: %s (%.1f s)", 
+                i + 1, len(jobs), entry['testName'], status, seconds)
+
+    report = pd.DataFrame(report)
+    report.attrs["stages"] = stages.to_frame()
+    nfailed = (report["status"] == "failed").sum()
+    logger.info("Finished, %d failed, report in %s", nfailed, report_file)
+    logger.debug("Time per stage, all cases:\n%s", report.attrs["stages"])
+
+    return report
+
+
+# ==============================================================================
+
+def convert_file(file, mat_file=None, **kwargs) -> str:
+    """
+    Convert a CSV or XLSX measurement file, depending on its extension.
+
+    Parameters
+    ----------
+    - file : str or Path
+        - Measurement file.
+    - mat_file : str or Path, optional
+        - Output file.
+    - kwargs
+        - Passed to `convert_csv_to_mat` / `convert_xlsx_to_mat`.
+
+    Returns
+    -------
+    - str
+        - Path of the MAT file.
+    """
+
+    suffix = Path(file).suffix.lower()
+    if suffix == ".csv":
+        return convert_csv_to_mat(file, mat_file, **kwargs)
+    elif suffix in (".xlsx", ".xlsm"):
+        return convert_xlsx_to_mat(file, mat_file, **kwargs)
+    else:
+        raise ValueError(f"Unsupported measurement file type: {file}")
+
+
+# ==============================================================================
+
+def main(argv=None):
+    """Command line entry point `skybox-convert`."""
+
+    parser = argparse.ArgumentParser(prog="skybox-convert",
+        description="Convert SkyBox CSV/XLSX measurement files to HDF5 MAT files.")
+    parser.add_argument("files", nargs="+",
+        help="CSV or XLSX measurement files")
+    parser.add_argument("-o", "--output",
+        help="Output MAT file (only with a single input file)")
+    parser.add_argument("--fsampling", type=float, default=2000.0,
+        help="Sampling frequency in Hz (default: 2000)")
+    parser.add_argument("--calibration",
+        help="XLSX file of the calibration test")
+    parser.add_argument("--default-data", default="MP3Filtered",
+        help="Group copied to DefaultData (default: MP3Filtered)")
+    parser.add_argument("--chunksize", type=int, default=100_000,
+        help="Rows read at once (default: 100000)")
+    parser.add_argument("--chunk-time", type=int,
+        help="Samples per HDF5 chunk along Time")
+    parser.add_argument("--compression", choices=["gzip", "lzf", "none"],
+        help="Compression filter (default: gzip)")
+    parser.add_argument("--float32", action="store_true",
+        help="Store the probe channels as float32")
+    parser.add_argument("--profile", action="store_true",
+        help="Print the time spent per stage")
+    args = parser.parse_args(argv)
+
+    skb_profiling.log_to_console()
+
+    if args.output and len(args.files) > 1:
+        parser.error("--output can only be used with a single input file")
+
+    calibration = None
+    calibTestName = None
+    if args.calibration:
+        calibration = read_calibration(args.calibration)
+        calibTestName = Path(args.calibration).stem
+
+    for file in args.files:
+        test_properties = {
+            'testName': Path(file).stem,
+            'fSampling': args.fsampling,
+            'calibrationFile': calibTestName if calibTestName else 'None' }
+
+        with skb_profiling.profile() as stages:
+            convert_file(file, args.output,
+                test_properties=test_properties, calibration=calibration,
+                default_data=args.default_data, chunksize=args.chunksize,
+                chunk_time=args.chunk_time, compression=args.compression,
+                dtype=np.float32 if args.float32 else None)
+        if args.profile:
+            print(stages)
+
+
+# ==============================================================================
+
+def main_batch(argv=None):
+    """Command line entry point `skybox-convert-batch`."""
+
+    parser = argparse.ArgumentParser(prog="skybox-convert-batch",
+        description="Convert the cases of a SkyBox test log in parallel.")
+    parser.add_argument("test_log", help="Test log spreadsheet")
+    parser.add_argument("root_dir", help="Root of the data tree")
+    parser.add_argument("--calibration", 
+        help="Name of the calibration test")
+    parser.add_argument("--fsampling", type=float, default=2000.0,
+        help="Sampling frequency in Hz (default: 2000)")
+    parser.add_argument("--ext", default="csv", choices=["csv", "xlsx"],
+        help="Measurement file type (default: csv)")
+    parser.add_argument("--rows", type=int, nargs="+",
+        help="Rows of the test log to convert (default: all)")
+    parser.add_argument("--query",
+        help="pandas query on the test log, e.g. \"C8 == 'regular'\"")
+    parser.add_argument("-j", "--workers", type=int,
+        help="Number of processes (default: number of cores)")
+    parser.add_argument("--report", help="CSV report file")
+    parser.add_argument("--force", action="store_true",
+        help="Convert also the cases that are up to date")
+    parser.add_argument("--default-data", default="MP3Filtered",
+        help="Group copied to DefaultData (default: MP3Filtered)")
+    parser.add_argument("--chunk-time", type=int,
+        help="Samples per HDF5 chunk along Time")
+    parser.add_argument("--compression", choices=["gzip", "lzf", "none"],
+        help="Compression filter (default: gzip)")
+    parser.add_argument("--float32", action="store_true",
+        help="Store the probe channels as float32")
+    parser.add_argument("--profile", action="store_true",
+        help="Print the time spent per stage, summed over all cases")
+    args = parser.parse_args(argv)
+
+    skb_profiling.log_to_console()
+
+    report = convert_test_log(args.test_log, args.root_dir,
+        calibTestName=args.calibration, fSampling=args.fsampling,
+        ext=args.ext, rows=args.rows, query=args.query,
+        max_workers=args.workers, report_file=args.report, force=args.force,
+        default_data=args.default_data, chunk_time=args.chunk_time,
+        compression=args.compression,
+        dtype=np.float32 if args.float32 else None)
+
+    if args.profile:
+        print(report.attrs["stages"])
+
+    return int((report["status"] == "failed").any())
+
+
+# ==============================================================================
+
+def _convert_case(caseFile, test_properties, calibration, kwargs) -> tuple:
+    """Worker of `convert_test_log`, returns (status, seconds, error, stages)."""
+
+    t0 = time.perf_counter()
+    with skb_profiling.profile() as stages:
+        try:
+            convert_file(caseFile, test_properties=test_properties,
+                calibration=calibration, **kwargs)
+            status, error = "done", ""
+        except Exception:
+            status, error = "failed", traceback.format_exc()
+    return status, time.perf_counter() - t0, error, stages.stages
+
+
+def _write_report(report: list, report_file):
+    """Write the report of `convert_test_log`, replacing the previous one."""
+
+    tmp = Path(f"{report_file}.tmp")
+    pd.DataFrame(report).to_csv(tmp, index=False)
+    os.replace(tmp, report_file)
+
+
+# ==============================================================================
+
+def _get_mat_file(file) -> Path:
+    """Output path next to the measurement, in the Measure_MAT folder."""
+
+    file = str(file).replace('Measure_XLS', 'Measure_MAT')
+    return Path(file).with_suffix('.mat')
+
+
+def _get_extra(test_properties, calibration) -> dict:
+    """Top-level entries stored next to the time series."""
+
+    extra = {}
+    if calibration:
+        extra.update(calibration)
+    if test_properties is not None:
+        extra.update({'TestProperties': test_properties})
+    return extra
+
+
+def _get_xlsx_block(group, fields, rows) -> dict:
+    """Block of `write_streamed_mat` from a list of XLSX rows."""
+
+    arr = np.array(rows, dtype=np.float64)
+    return {group: {f: arr[:, i] for i, f in enumerate(fields)}}
+
+
+if __name__ == "__main__":
+    main()
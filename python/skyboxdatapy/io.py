@@ -4,13 +4,24 @@ This module provides functions for handling data paths and saving/loading
 data files in various formats, particularly HDF5 MATLAB files.
 """
 
+import logging
 import pathlib
+import warnings
+import h5py
 import hdf5storage
 import numpy as np
 import xarray as xr
 import pandas as pd
 from pathlib import Path
 
+from . import cache as skb_cache
+from . import calibration as skb_calibration
+from . import catalog as skb_catalog
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
+
 
 # ==============================================================================
 
@@ -33,16 +44,24 @@ all_probe_names = [
 def find_unique_file(
         root_dir: str, 
         testName: str, 
-        ext :str ="*") -> str:
+        ext :str ="*",
+        *, catalog=False) -> str:
     """Find a single file matching a pattern in a directory tree.
     
     Recursively searches through a directory and its subdirectories for files 
     matching the specified test name and extension. Expects exactly one match.
+
+    With `catalog` the search uses the persistent file catalog of `root_dir`
+    (see `skyboxdatapy.catalog`) instead of walking the tree on every call.
+    The catalog is updated before each search, which only lists again the
+    directories whose mtime changed, so the result is the same as the walk.
     
     Args:
     - root_dir: Root directory to start the recursive search from
     - testName: Test name pattern to match at the beginning of filenames
     - ext: File extension to match (default: "*" for any extension)
+    - catalog: False to walk the tree, True to use the default catalog, 
+        or the path of a catalog file (default: False)
         
     Returns:
     - Path to the single file found matching the pattern
@@ -60,8 +79,14 @@ def find_unique_file(
     """
     
     pattern = f"{testName}*.{ext}" 
-    files = list(Path(root_dir).rglob(pattern))
-    files = [str(f) for f in files]
+
+    if catalog:
+        catalog_path = None if catalog is True else catalog
+        catalog_path = skb_catalog.update_catalog(root_dir, catalog_path)
+        files = skb_catalog.query_catalog(root_dir, pattern, catalog_path)
+    else:
+        files = list(Path(root_dir).rglob(pattern))
+        files = [str(f) for f in files]
 
     if len(files) != 1:
         error_msg = f"Expected 1 file for test case {testName}, found {len(files)}"
@@ -75,32 +100,169 @@ def find_unique_file(
 
 # ==============================================================================
 
-def save_hdf5_mat(path: pathlib.Path, data: dict):
+def save_hdf5_mat(path: pathlib.Path, data: dict,
+    *, chunk_time=None, compression=None, compression_opts=None, 
+    shuffle=True, dtype=None, probe_names=all_probe_names):
     """Save data to an HDF5 MATLAB file.
+
+    Without any storage option the file is written by hdf5storage with its 
+    default filters (gzip with shuffle, automatic chunks).
+    With `chunk_time`, `compression` or `dtype`, the 'Time' and probe 
+    vectors of the time series groups are written with the requested chunks 
+    and filters, and the file stays a MATLAB v7.3 file.
     
     Args:
     - path: Output file path.
     - data: Dictionary containing data to save.
+    - chunk_time: Number of samples per chunk along Time for the probe vectors.
+        Windowed reads with `load_case(..., time=...)` read whole chunks.
+        - Default: None, automatic chunks.
+    - compression: Filter for the probe vectors: "gzip", "lzf" or "none".
+        Note that MATLAB can only read "gzip" and "none".
+        - Default: None, hdf5storage default (gzip).
+    - compression_opts: gzip compression level 0-9. 
+        - Default: None, level 4 from h5py.
+    - shuffle: Use the shuffle filter with compression (default: True).
+    - dtype: Storage dtype for the probe channels, e.g. np.float32 (MATLAB 'single'). 
+        'Time' is always kept as float64.
+        - Default: None, keep the input dtype.
+    - probe_names: Names of the probe channels.
         
     Raises:
     - Exception: If saving fails.
     """
+
+    if compression == "lzf":
+        warnings.warn("lzf compressed MAT files can not be read by MATLAB")
+
+    series = {}
+    if (chunk_time is not None) or (compression is not None) or \
+            (dtype is not None):
+        data, series = _split_series(data, dtype, probe_names)
+
     try:
-        hdf5storage.savemat(
-            str(path),
-            data,
-            format="7.3",
-            oned_as="column",
-            store_python_metadata=False,
-            matlab_compatible=True,
-            truncate_existing=True
-        )
-        print("=== Successfully saved using hdf5storage (nested structure with additional options) ===\n")
+        with skb_profiling.stage("hdf5_write") as st:
+            hdf5storage.savemat(
+                str(path),
+                data,
+                format="7.3",
+                oned_as="column",
+                store_python_metadata=False,
+                matlab_compatible=True,
+                truncate_existing=True
+            )
+
+            if series:
+                _write_series(path, series, chunk_time=chunk_time,
+                    compression=compression, compression_opts=compression_opts,
+                    shuffle=shuffle)
+            st.nbytes = Path(path).stat().st_size
+
+        logger.info("Saved %s using hdf5storage", path)
     
     except Exception as e:
         raise RuntimeError(f"hdf5storage (nested with options) failed:\n{e}")
 
 
+# ==============================================================================
+
+_matlab_class = {
+    np.dtype(np.float64): "double", np.dtype(np.float32): "single",
+    np.dtype(np.int8): "int8", np.dtype(np.uint8): "uint8",
+    np.dtype(np.int16): "int16", np.dtype(np.uint16): "uint16",
+    np.dtype(np.int32): "int32", np.dtype(np.uint32): "uint32",
+    np.dtype(np.int64): "int64", np.dtype(np.uint64): "uint64" }
+
+
+def _split_series(data: dict, dtype, probe_names) -> tuple:
+    """Replace the Time and probe vectors of time series groups by placeholders.
+
+    Returns the data to write with hdf5storage, which creates the MATLAB 
+    struct layout, and the {(group, field): vector} to write afterwards.
+    """
+
+    data_out = {}
+    series = {}
+
+    for l1key, l1 in data.items():
+        if isinstance(l1, dict) and ("Time" in l1):
+            l2 = {}
+            for f, val in l1.items():
+                arr = np.asarray(val)
+                if ((f == "Time") or (f in probe_names)) and \
+                        (arr.ndim == 1) and (arr.size > 1) and \
+                        (arr.dtype in _matlab_class):
+                    if (f != "Time") and (dtype is not None):
+                        arr = arr.astype(dtype, copy=False)
+                    series.update({(l1key, f): arr})
+                    val = np.float64(0)
+                l2.update({f: val})
+            l1 = l2
+        data_out.update({l1key: l1})
+
+    return data_out, series
+
+
+def _write_series(path, series: dict, *, chunk_time, compression,
+        compression_opts, shuffle):
+    """Overwrite the placeholders of `_split_series` with chunked datasets."""
+
+    with h5py.File(path, "r+") as h5:
+        for (l1key, f), arr in series.items():
+            _replace_placeholder(h5[l1key], f, arr, chunk_time=chunk_time,
+                compression=compression, compression_opts=compression_opts,
+                shuffle=shuffle)
+
+
+def _replace_placeholder(grp: h5py.Group, field: str, arr: np.ndarray, 
+        *, chunk_time=None, compression=None, compression_opts=None, 
+        shuffle=True, resizable=False) -> h5py.Dataset:
+    """Replace a placeholder field of a MATLAB struct by the vector `arr`.
+
+    The MATLAB attributes of the placeholder are kept. With `resizable` the
+    dataset can be extended along Time afterwards, see `_append_series`.
+    """
+
+    if compression == "none":
+        compression = None
+    elif compression is None:
+        compression = "gzip"
+
+    name = hdf5storage.pathesc.escape_path(field)
+    attrs = dict(grp[name].attrs)
+    del grp[name]
+
+    # MATLAB column vectors are stored as (1, N)
+    chunks = None
+    maxshape = None
+    if resizable:
+        chunks = (1, int(chunk_time or 2**14))
+        maxshape = (1, None)
+    elif chunk_time is not None:
+        chunks = (1, int(max(1, min(chunk_time, arr.size))))
+    elif compression is not None:
+        chunks = True
+
+    dset = grp.create_dataset(name, data=arr.reshape(1, -1),
+        chunks=chunks, maxshape=maxshape, compression=compression, 
+        compression_opts=compression_opts if compression == "gzip" else None,
+        shuffle=bool(shuffle and (compression is not None)))
+
+    attrs.update({"MATLAB_class": np.bytes_(_matlab_class[arr.dtype])})
+    for k, v in attrs.items():
+        dset.attrs[k] = v
+
+    return dset
+
+
+def _append_series(dset: h5py.Dataset, arr: np.ndarray):
+    """Append samples to a resizable dataset made by `_replace_placeholder`."""
+
+    n0 = dset.shape[1]
+    dset.resize((1, n0 + arr.size))
+    dset[0, n0:] = arr
+
+
 # ==============================================================================
 
 def load_hdf5_mat(path: pathlib.Path) -> dict:
@@ -116,16 +278,18 @@ def load_hdf5_mat(path: pathlib.Path) -> dict:
     - Exception: If loading fails.
     """
     try:
-        print("\n=== Reading MAT ===")
-        data = hdf5storage.loadmat(path)
+        logger.info("Reading MAT %s", path)
+        with skb_profiling.stage("hdf5_read") as st:
+            data = hdf5storage.loadmat(path)
+            st.nbytes = Path(path).stat().st_size
         data2 = {}
 
-        print("Top-level keys:", list(data.keys()))
+        logger.debug("Top-level keys: %s", list(data.keys()))
 
-        for l1key,l1 in data.items():
-            data2.update({ l1key: cleanAttributes(l1) })                
+        with skb_profiling.stage("clean_attributes"):
+            for l1key,l1 in data.items():
+                data2.update({ l1key: cleanAttributes(l1) })                
         
-        print("=== Successfully loaded using hdf5storage ===\n")                
         return data2
     
     except Exception as e:
@@ -136,19 +300,109 @@ def load_hdf5_mat(path: pathlib.Path) -> dict:
 # ==============================================================================
 
 def load_case(file,
-    *,probe_names=all_probe_names) -> dict:
+    *,probe_names=all_probe_names,
+    groups=None, probes=None, time=None, layout="variables",
+    cache=False, chunks=None, calibration=None,
+    calibrated_groups=("MP3RawValue",), dtype=None) -> dict:
     """
     Load a case from an HDF5 MAT file and convert probe data to xarray format.
+
+    Without any selection the whole file is read with `load_hdf5_mat`.
+    If `groups`, `probes` or `time` is given, only the requested part is read
+    directly from the HDF5 datasets with `load_hdf5_mat_selection`.
+    With `chunks` the probe vectors are not read at all: they are dask arrays
+    over the HDF5 datasets, read chunk by chunk on `.compute()`, `.values` 
+    or plotting.
+
     Args:
     - file: Path to the HDF5 MAT file to load.
     - probe_names: Names of probes to use when converting to xarray format.
+    - groups: Top-level groups to load, e.g. ["DefaultData", "TestProperties"]. 
+        - Default: None, all groups.
+    - probes: Probes to load from the time series groups, e.g. ["WG01"].
+        - Default: None, all probes in `probe_names`.
+    - time: Tuple (t0, t1) of the time window to load, inclusive. 
+        Either bound can be None.
+        - Default: None, the full record.
+    - layout: "variables" for one variable per probe or "stacked" for a single
+        (probe, Time) variable, see `convert_dict_to_xarray`.
+        - Default: "variables".
+    - cache: False, True to use the on-disk case cache (see `skyboxdatapy.cache`),
+        or the path of a cache directory.
+        - Default: False.
+    - chunks: Samples per dask chunk along Time (int, "auto" or any dask 
+        `chunks` value). Requires the optional `dask` dependency.
+        - Default: None, NumPy arrays.
+    - calibration: Calibration applied to the `calibrated_groups`, see 
+        `skyboxdatapy.calibration`: a Dataset from `get_calibration`, the name 
+        of a cached calibration test, or True for the ConversionFactor and 
+        ConversionOffset sheets stored in the case.
+        - Default: None, no conversion.
+    - calibrated_groups: Groups converted with `calibration`, if loaded.
+        - Default: ("MP3RawValue",).
+    - dtype: Storage dtype of the probes, e.g. np.float32 to halve the 
+        memory. The probes are converted while they are read, Time stays 
+        float64. Tare, resampling and spectra keep the dtype and accumulate 
+        in float64.
+        - Default: None, the dtype of the file (float64).
+
     Returns:
     - dict: Dictionary containing the loaded data, with DefaultData and MP3 entries
               converted to xarray datasets, and other entries preserved as-is.
+
+    Examples:
+
+        >>> load_case(file, groups=["DefaultData", "TestProperties"], 
+        ...     probes=["WG01"], time=(30, 80))
     """
 
-    
-    loaded_mat = load_hdf5_mat(file)
+    if calibration is not None:
+        ret_mat = load_case(file, probe_names=probe_names, groups=groups,
+            probes=probes, time=time, layout=layout, cache=cache, chunks=chunks,
+            dtype=dtype)
+        if calibration is True:
+            with h5py.File(file, "r") as h5:
+                sheets = [g for g in (skb_calibration.factor_sheet,
+                    skb_calibration.offset_sheet, "TestProperties") if g in h5]
+            calibration = skb_calibration.calibration_from_case(
+                load_hdf5_mat_selection(file, groups=sheets))
+        elif isinstance(calibration, str):
+            calibration = skb_calibration.get_calibration(calibration)
+        for g in calibrated_groups:
+            if g in ret_mat:
+                ret_mat.update({g: skb_calibration.apply_calibration(
+                    ret_mat[g], calibration)})
+        return ret_mat
+
+    if cache:
+        options = {"probe_names": list(probe_names), 
+            "groups": groups, "probes": probes, "time": time}
+        if layout != "variables":
+            options.update({"layout": layout})
+        if dtype is not None:
+            options.update({"dtype": np.dtype(dtype).str})
+        ret_mat = skb_cache.load_cached(file,
+            lambda f: load_case(f, probe_names=probe_names, 
+                groups=groups, probes=probes, time=time, layout=layout,
+                dtype=dtype),
+            options, cache_dir=None if cache is True else cache)
+        if chunks is not None:
+            ret_mat = {k: v.chunk({"Time": chunks}) if isinstance(v, xr.Dataset) 
+                else v for k, v in ret_mat.items()}
+        return ret_mat
+
+    if chunks is not None:
+        loaded_mat = load_hdf5_mat_selection(file, 
+            groups=groups, probes=probes, time=time, 
+            probe_names=probe_names, chunks=chunks, dtype=dtype)
+    elif (groups is None) and (probes is None) and (time is None) \
+            and (dtype is None):
+        loaded_mat = load_hdf5_mat(file)
+    else:
+        # Also with only `dtype`: converted while reading, no float64 copy
+        loaded_mat = load_hdf5_mat_selection(file, 
+            groups=groups, probes=probes, time=time, 
+            probe_names=probe_names, dtype=dtype)
 
     ret_mat = {}
 
@@ -156,7 +410,7 @@ def load_case(file,
         
         if (l1key == "DefaultData") or ("MP3" in l1key):
             ds_xr = convert_dict_to_xarray(l1val, 
-                probe_names=probe_names)
+                probe_names=probe_names, layout=layout, dtype=dtype)
             ret_mat.update({l1key: ds_xr})
         
         else:
@@ -165,34 +419,322 @@ def load_case(file,
     return ret_mat
 
 
+# ==============================================================================
+
+def load_hdf5_mat_selection(path: pathlib.Path, 
+    *, groups=None, probes=None, time=None,
+    probe_names=all_probe_names, chunks=None, dtype=None) -> dict:
+    """Load a selection of an HDF5 MATLAB file using hyperslab reads.
+
+    Only the requested groups and probes are opened, and for groups with a 
+    'Time' field only the samples inside the time window are read. 
+    The output has the same layout as `load_hdf5_mat`.
+    
+    Args:
+    - path: Input file path.
+    - groups: Top-level groups to load. Default None loads all groups.
+    - probes: Probes to load. Default None loads all probes.
+    - time: Tuple (t0, t1) of the time window to load, inclusive. 
+        Default None loads the full record.
+    - probe_names: Names of the probe channels. Fields not in this list 
+        (e.g. 'reference') are always read in full.
+    - chunks: If given, the probe vectors are returned as dask arrays with 
+        these chunks along Time instead of being read.
+    - dtype: If given, the probe vectors are converted to this dtype by 
+        HDF5 while they are read.
+
+    Returns:
+    - Dictionary containing loaded data.
+    
+    Raises:
+    - KeyError: If a requested group is not in the file.
+    """
+
+    if isinstance(groups, str):
+        groups = [groups]
+    if isinstance(probes, str):
+        probes = [probes]
+
+    logger.info("Reading MAT (selection) %s", path)
+
+    data = {}
+
+    with h5py.File(path, "r") as h5, skb_profiling.stage("hdf5_read") as st:
+
+        logger.debug("Top-level keys: %s", list(h5.keys()))
+
+        if groups is None:
+            groups = [k for k in h5.keys() if not k.startswith("#")]
+
+        for l1key in groups:
+            if l1key not in h5:
+                raise KeyError(f"Group {l1key} not found in {path}")
+            
+            l1 = h5[l1key]
+            if not isinstance(l1, h5py.Group):
+                data.update({l1key: _read_mat_dataset(l1)})
+                continue
+
+            fields = _get_mat_fields(l1)
+            
+            # Only time series groups are sliced and filtered by probe
+            is_series = "Time" in fields
+
+            tslice = slice(None)
+            if is_series and (time is not None):
+                tslice = _get_time_slice(l1["Time"], time)
+
+            l2 = {}
+            for f in fields:
+                if not is_series:
+                    l2.update({f: _read_mat_dataset(l1[f])})
+                elif (f == "Time") or (f in probe_names):
+                    if (probes is not None) and (f != "Time") \
+                            and (f not in probes):
+                        continue
+                    if (chunks is not None) and (f != "Time"):
+                        l2.update({f: _lazy_mat_dataset(l1[f], tslice, chunks,
+                            dtype=dtype)})
+                    elif f != "Time":
+                        l2.update({f: _read_mat_dataset(l1[f], tslice,
+                            dtype=dtype)})
+                    else:
+                        l2.update({f: _read_mat_dataset(l1[f], tslice)})
+                else:
+                    l2.update({f: _read_mat_dataset(l1[f])})
+
+            data.update({l1key: l2})
+            st.nbytes += sum(v.nbytes for v in l2.values() 
+                if isinstance(v, np.ndarray))
+
+    return data
+
+
+# ==============================================================================
+
+def _get_mat_fields(grp: h5py.Group) -> list:
+    """Field names of a MATLAB struct group, in the order stored by MATLAB."""
+
+    names = grp.attrs.get("MATLAB_fields", None)
+    if names is None:
+        return list(grp.keys())
+
+    fields = []
+    for n in names:
+        n = b"".join(np.atleast_1d(n)).decode()
+        if n in grp:
+            fields.append(n)
+    return fields
+
+
+def _get_time_slice(dset: h5py.Dataset, time) -> slice:
+    """Index slice of the samples inside the inclusive window (t0, t1)."""
+    
+    t0, t1 = time
+    t = _read_mat_dataset(dset)
+    
+    i0 = 0 if t0 is None else int(np.searchsorted(t, t0, side="left"))
+    i1 = t.size if t1 is None else int(np.searchsorted(t, t1, side="right"))
+    return slice(i0, i1)
+
+
+def _read_mat_dataset(dset: h5py.Dataset, tslice: slice = slice(None),
+    dtype=None):
+    """Read a MATLAB dataset, flattened the same way as `cleanAttributes`.
+
+    Vectors are read only over `tslice` along their long axis. 
+    Char arrays are returned as str and single values as numpy scalars.
+    Numeric arrays are converted to `dtype` by HDF5 while reading.
+    """
+
+    if isinstance(dset, h5py.Group):
+        return {f: _read_mat_dataset(dset[f]) for f in _get_mat_fields(dset)}
+
+    mclass = dset.attrs.get("MATLAB_class", b"")
+    if isinstance(mclass, bytes):
+        mclass = mclass.decode()
+
+    if "MATLAB_empty" in dset.attrs and dset.attrs["MATLAB_empty"]:
+        return "" if mclass == "char" else np.array([])
+
+    if (mclass not in ("", "char", "logical")) and \
+            (dset.dtype.kind not in "iuf"):
+        # cells, references, ... : let hdf5storage decode them
+        return np.asarray(
+            hdf5storage.read(path=dset.name, filename=dset.file.filename)
+        ).flatten()
+
+    src = dset
+    if (dtype is not None) and (mclass not in ("char", "logical")):
+        src = dset.astype(dtype)
+
+    shape = dset.shape
+    if (len(shape) == 2) and (shape[0] == 1):
+        arr = src[0, tslice]
+    elif (len(shape) == 2) and (shape[1] == 1):
+        arr = src[tslice, 0]
+    else:
+        arr = src[()].flatten()
+
+    if mclass == "char":
+        return _decode_mat_char(arr)
+    if mclass == "logical":
+        arr = arr.astype(bool)
+    
+    if arr.size == 1:
+        return arr[0]
+    return arr
+
+
+def _lazy_mat_dataset(dset: h5py.Dataset, tslice: slice, chunks, dtype=None):
+    """Dask array over a MATLAB vector, or the values if it is not a vector."""
+
+    import dask.array
+    from dask.base import tokenize
+
+    shape = dset.shape
+    if (len(shape) != 2) or (1 not in shape) or \
+            (dset.attrs.get("MATLAB_class", b"") in (b"char", b"logical")):
+        return _read_mat_dataset(dset, tslice, dtype=dtype)
+
+    series = _MatSeries(dset.file.filename, dset.name, 
+        tslice.indices(max(shape)), shape[0] == 1, 
+        dset.dtype if dtype is None else dtype)
+    # The version of the file is part of the key, so chunks kept by dask
+    # for a file that was rewritten since are not reused
+    st = Path(series.path).stat()
+    return dask.array.from_array(series, chunks=chunks, 
+        name="mat-" + tokenize(series.path, st.st_size, st.st_mtime_ns,
+            series.name, series.start, series.shape[0], series.dtype.str),
+        lock=False)
+
+
+class _MatSeries:
+    """Array-like view of a MATLAB vector, read from the file on indexing.
+
+    The file is opened for each read, so the view can be pickled and read
+    concurrently by dask threads or processes. The values are converted to 
+    `dtype` by HDF5.
+    """
+
+    def __init__(self, path, name, indices, is_row, dtype):
+        self.path = str(path)
+        self.name = name
+        self.start, stop, _ = indices
+        self.shape = (max(stop - self.start, 0),)
+        self.is_row = is_row
+        self.dtype = np.dtype(dtype)
+        self.ndim = 1
+
+    def __getitem__(self, key):
+        key = key[0] if isinstance(key, tuple) else key
+        if not isinstance(key, slice):
+            return self[:][key]
+        i0, i1, step = key.indices(self.shape[0])
+        sel = slice(self.start + i0, self.start + max(i1, i0))
+        with h5py.File(self.path, "r") as h5:
+            dset = h5[self.name]
+            if dset.dtype != self.dtype:
+                dset = dset.astype(self.dtype)
+            arr = dset[0, sel] if self.is_row else dset[sel, 0]
+        return arr[::step]
+
+
+def _decode_mat_char(arr: np.ndarray) -> str:
+    """Decode a MATLAB uint16 char array to str without a per-character loop."""
+
+    arr = np.ascontiguousarray(arr.flatten(), dtype="<u4")
+    if arr.size == 0:
+        return ""
+    return str(arr.view(f"<U{arr.size}")[0])
+
+
 # ==============================================================================
 
 def convert_dict_to_xarray(ds: dict, 
-    * , probe_names = all_probe_names ) -> xr.Dataset:        
+    * , probe_names = all_probe_names, layout = "variables", 
+    dtype = None ) -> xr.Dataset:        
     """
     Convert a dictionary to an xarray Dataset.
+
+    With layout "stacked" all probes are put in one contiguous 2D variable 
+    `probes` with dimensions (probe, Time), allocated once. 
+    The probe names are the `probe` coordinate and the probe type 
+    (WG, Mo, PS, ...) the `probe_type` coordinate. Operations over all probes
+    are then a single NumPy call, e.g. `ds['probes'].max('Time')`.
     
     Args:
     - ds: Dictionary containing time series data with 'Time' key and probe data
     - probe_names: List of probe names to be converted to data variables in the xarray Dataset
         - Default value: predefined list of probe names
+    - layout: "variables" for one 1D variable per probe, "stacked" for a 2D
+        (probe, Time) variable `probes`
+        - Default value: "variables"
+    - dtype: dtype of the probe data, e.g. np.float32. Time is not converted.
+        - Default value: None, the dtype of the input arrays
     
     Returns:
     - xr.Dataset: Dataset with Time coordinate, probe data as variables, and other keys as attributes
     """
     
+    if layout not in ("variables", "stacked"):
+        raise ValueError(f"Unknown layout {layout}, use 'variables' or 'stacked'")
+
+    with skb_profiling.stage("xarray_build") as st:
+        ds_xr = xr.Dataset( coords={'Time': ds['Time']} )
+
+        names = []
+        for l1key, l1val in ds.items():
+            if l1key == 'Time':
+                continue
+            elif l1key in probe_names:
+                if layout == "stacked":
+                    names.append(l1key)
+                else:
+                    if dtype is not None:
+                        l1val = l1val.astype(dtype, copy=False)
+                    ds_xr[l1key] = ( 'Time', l1val )
+                    st.nbytes += ds_xr[l1key].nbytes
+            else:
+                ds_xr.attrs[l1key] = l1val
+
+        if layout == "stacked":
+            if any(hasattr(ds[n], "dask") for n in names):
+                # lazy probes (load_case with chunks) stay lazy
+                import dask.array
+                data = dask.array.stack([dask.array.asarray(ds[n]) for n in names])
+                if dtype is not None:
+                    data = data.astype(dtype, copy=False)
+            else:
+                if dtype is None:
+                    dtype = np.result_type(*[ds[n] for n in names]) if names else np.float64
+                data = np.empty((len(names), len(ds['Time'])), dtype=dtype)
+                for i, n in enumerate(names):
+                    data[i] = ds[n]
+
+            ds_xr['probes'] = ( ('probe', 'Time'), data )
+            st.nbytes = data.nbytes
+            ds_xr = ds_xr.assign_coords(
+                probe = names,
+                probe_type = ('probe', [get_probe_type(n) for n in names]) )
 
-    ds_xr = xr.Dataset( coords={'Time': ds['Time']} )
+    return ds_xr
 
-    for l1key, l1val in ds.items():
-        if l1key == 'Time':
-            continue
-        elif l1key in probe_names:
-            ds_xr[l1key] = ( 'Time', l1val )
-        else:
-            ds_xr.attrs[l1key] = l1val
 
-    return ds_xr
+# ==============================================================================
+
+def get_probe_type(probe_name: str) -> str:
+    """
+    Type of a probe from its name, e.g. 'WG' for 'WG01' and 'PS' for 'PS12'.
+
+    Args:
+    - probe_name: Name of the probe.
+
+    Returns:
+    - str: Name without the trailing channel number.
+    """
+
+    return probe_name.rstrip("0123456789")
     
     
 # ==============================================================================
@@ -201,10 +743,12 @@ def cleanAttributes(l1: np.ndarray) -> dict:
     """
     Flatten all arrays and convert the character arrays to strings.
     Needed because of the way HDF5 stores data.
-    Additionaly export
-    - allAttributes: list of all attribute names
-    - convertedAttributes: list of attributes converted to strings
-    - unconvertedAttributes: list of attributes not converted to strings
+
+    The fields are classified once from the struct dtype. Character arrays
+    are decoded with a single NumPy view instead of joining characters, and
+    numeric arrays are returned as flat views of `l1` without copies.
+    Empty fields give '' (character arrays) or an empty array.
+    The character fields come first in the output, as before.
 
     Args:
     - l1: np.ndarray, usually each struct in the .mat
@@ -215,30 +759,39 @@ def cleanAttributes(l1: np.ndarray) -> dict:
         
     l2 = {}
     convertedAttributes = []
+    unconvertedAttributes = []
 
     names = getattr(l1.dtype, "names", None)
 
     for f in names:
-        lattr = l1[f].flatten()
-        if( type(lattr[0]) == np.str_):
+        base = l1.dtype.fields[f][0].base
+        if base.kind == 'U':
             convertedAttributes.append(f)
-    
-    allAttributes = list(names)                
-    unconvertedAttributes = [f for f in names if f not in convertedAttributes]   
-
-    # l2.update({
-    #     'allAttributes': allAttributes,
-    #     'convertedAttributes': convertedAttributes,
-    #     'unconvertedAttributes': unconvertedAttributes
-    # })
+        elif base.kind == 'O':
+            # Objects: classify from the first element, as hdf5storage 
+            # may return strings inside object arrays
+            lattr = l1[f].ravel()
+            if (lattr.size > 0) and isinstance(lattr[0], np.str_):
+                convertedAttributes.append(f)
+            else:
+                unconvertedAttributes.append(f)
+        else:
+            unconvertedAttributes.append(f)
 
     for f in convertedAttributes:
-        lattr = l1[f].flatten()
-        newval = ''.join(lattr)
+        lattr = l1[f].ravel()
+        if lattr.dtype.kind == 'O':
+            newval = ''.join(lattr)
+        elif lattr.size == 0:
+            newval = ''
+        else:
+            # Bulk view of the N characters as one string of length N
+            n = lattr.size * lattr.dtype.itemsize // 4
+            newval = str(np.ascontiguousarray(lattr).view(f'<U{n}')[0])
         l2.update({f: newval})
     
     for f in unconvertedAttributes:
-        lattr = l1[f].flatten()
+        lattr = l1[f].ravel()
         if(lattr.size ==1):
             newval = lattr[0]
         else:
@@ -1,18 +1,32 @@
+import logging
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import pandas as pd
 import xarray as xr
 import scipy as sp
-import matplotlib.pyplot as plt
+
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
 
 # ==============================================================================
 
-def update_LED_transition_indices(dfIn: xr.Dataset):
+def update_LED_transition_indices(dfIn: xr.Dataset, threshold = 0.0):
     """
     Identifies LED transition indices and adds them as dataset attributes.
+
+    Uses the edges from `get_LED_edges`, so the LED channel is scanned chunk
+    by chunk instead of building the index array of all samples that are on.
     
     Parameters
     ----------
     - dfIn : xr.Dataset
         - Dataset with 'Time' and 'LED-chan100' variables. Modified in-place.
+    - threshold : float, optional
+        - The LED is on above this value. Default is 0.
     
     Attributes Added
     ----------------
@@ -27,29 +41,148 @@ def update_LED_transition_indices(dfIn: xr.Dataset):
     """
 
     
-    t = dfIn['Time'].values
-    led = dfIn['LED-chan100'].values
+    t = dfIn['Time']
+    led = dfIn['LED-chan100']
+    n = led.sizes['Time']
 
-    ind = np.where(led > 0)
-    ind = ind[0]
+    edges = get_LED_edges(dfIn, threshold=threshold)
+    rising = edges[edges['edge'] == 'rising']['index'].values
+    falling = edges[edges['edge'] == 'falling']['index'].values
 
-    if(len(ind) == 0):
-        print("No LED transitions found in 'LED-chan100' data.")
+    # First and last sample above the threshold
+    first_on = led[0].item() > threshold
+    last_on = led[-1].item() > threshold
+
+    if (len(rising) == 0) and (len(falling) == 0) and not first_on:
+        logger.warning("No LED transitions found in 'LED-chan100' data.")
         dfIn.attrs['LED_index_0_to_1'] = 0
         dfIn.attrs['LED_index_1_to_0'] = 0
         dfIn.attrs['LED_time_0_to_1'] = 0
         dfIn.attrs['LED_time_1_to_0'] = 0
     else:
-        dfIn.attrs['LED_index_0_to_1'] = ind[0]
-        dfIn.attrs['LED_index_1_to_0'] = ind[-1]
-        dfIn.attrs['LED_time_0_to_1'] = t[ind[0]]
-        dfIn.attrs['LED_time_1_to_0'] = t[ind[-1]]
+        i0 = 0 if first_on else int(rising[0])
+        i1 = n - 1 if last_on else int(falling[-1]) - 1
+        dfIn.attrs['LED_index_0_to_1'] = i0
+        dfIn.attrs['LED_index_1_to_0'] = i1
+        dfIn.attrs['LED_time_0_to_1'] = t[i0].item()
+        dfIn.attrs['LED_time_1_to_0'] = t[i1].item()
         
 
+# ==============================================================================
+
+def get_LED_edges(dfIn, threshold = 0.0, probe = 'LED-chan100', chunk_size = 2**20):
+    """
+    Find all rising and falling edges of the LED (video sync) channel.
+
+    The channel is read chunk by chunk, so lazily loaded data is never 
+    loaded whole. Edge times are linearly interpolated between the two 
+    samples around the threshold crossing.
+    
+    Parameters
+    ----------
+    - dfIn : xr.Dataset or xr.DataArray
+        - Dataset with 'Time' and the LED channel, or the LED channel itself.
+    - threshold : float, optional
+        - The LED is on above this value. Default is 0.
+    - probe : str, optional
+        - Name of the LED channel. Default is 'LED-chan100'.
+    - chunk_size : int, optional
+        - Samples read at once. Default is 2**20.
+    
+    Returns
+    -------
+    - pandas.DataFrame
+        - One row per edge, in time order, with columns
+            - edge : 'rising' or 'falling'
+            - index : first sample after the crossing
+            - time : interpolated time of the crossing
+    """
+
+    led = dfIn[probe] if isinstance(dfIn, xr.Dataset) else dfIn
+    n = led.sizes['Time']
+
+    index = []
+    kind = []
+    time = []
+
+    with skb_profiling.stage("led_edges") as st:
+        for i0 in range(0, max(n - 1, 0), chunk_size):
+            # One sample of overlap to catch edges across chunks
+            chunk = led.isel(Time=slice(i0, min(i0 + chunk_size + 1, n)))
+            x = np.asarray(chunk.values, dtype=np.float64)
+            t = np.asarray(chunk['Time'].values, dtype=np.float64)
+            st.nbytes += x.nbytes
+
+            on = x > threshold
+            k = np.flatnonzero(on[1:] != on[:-1])
+            if len(k) == 0:
+                continue
+
+            frac = (threshold - x[k]) / (x[k + 1] - x[k])
+            index.append(i0 + k + 1)
+            kind.append(np.where(on[k + 1], 'rising', 'falling'))
+            time.append(t[k] + frac * (t[k + 1] - t[k]))
+
+    if not index:
+        return pd.DataFrame({'edge': pd.Series(dtype=str), 
+            'index': pd.Series(dtype=int), 'time': pd.Series(dtype=float)})
+
+    return pd.DataFrame({
+        'edge': np.concatenate(kind),
+        'index': np.concatenate(index),
+        'time': np.concatenate(time) })
 
 # ==============================================================================
 
-def set_all_probe_tare(dsIn, start_time, end_time):
+def get_LED_time_shift(edges, video_on_times):
+    """
+    Time shift between video LED events and the sensor LED edges.
+
+    Every pairing of the first video LED-on event with a sensor rising edge 
+    is tried, and the one that best matches all video LED-on events is kept.
+    With multiple pulses this is robust to missing or extra pulses.
+    
+    Parameters
+    ----------
+    - edges : pandas.DataFrame
+        - Output of `get_LED_edges`.
+    - video_on_times : array-like
+        - Times of the LED-on events in the video (in s).
+    
+    Returns
+    -------
+    - float
+        - Time shift to add to the video times to match the sensor times.
+    - float
+        - Mean absolute mismatch of the video events after the shift (in s).
+
+    Example
+    -------
+
+        >>> edges = get_LED_edges(ds2)
+        >>> tShift_peaks, err = get_LED_time_shift(edges, testpeaks_LED_on.values)
+    """
+
+    rising = np.sort(edges[edges['edge'] == 'rising']['time'].values)
+    video = np.sort(np.asarray(video_on_times, dtype=np.float64))
+    if (len(rising) == 0) or (len(video) == 0):
+        raise ValueError("Need at least one sensor rising edge and one video LED-on event")
+
+    # (candidate shift, video event) -> distance to the nearest sensor edge
+    shifts = rising - video[0]
+    shifted = video[np.newaxis, :] + shifts[:, np.newaxis]
+    j = np.searchsorted(rising, shifted)
+    hi = np.clip(j, 0, len(rising) - 1)
+    lo = np.clip(j - 1, 0, len(rising) - 1)
+    dist = np.minimum(np.abs(rising[hi] - shifted), np.abs(rising[lo] - shifted))
+    err = dist.mean(axis=1)
+
+    best = np.argmin(err)
+    return float(shifts[best]), float(err[best])
+
+# ==============================================================================
+
+def set_all_probe_tare(dsIn, start_time, end_time, mode = 'copy'):
     """
     Tare all probes in the dataset using the mean value over a specified time range.
     
@@ -61,6 +194,13 @@ def set_all_probe_tare(dsIn, start_time, end_time):
         - Start time for calculating tare values.
     - end_time : datetime-like
         - End time for calculating tare values.
+    - mode : str, optional
+        - How the tare is applied. Default is 'copy'.
+            - 'copy': return a new dataset, dsIn is unchanged.
+            - 'inplace': subtract in the arrays of dsIn, without a copy. 
+            Any dataset sharing these arrays sees the change.
+            - 'lazy': keep the data and store the tare as the `tare_offset`
+            attribute of each variable, see `apply_tare`.
     
     Returns
     -------
@@ -68,27 +208,11 @@ def set_all_probe_tare(dsIn, start_time, end_time):
         - Dataset with tare values subtracted from all probes, with `tare_values` stored in attributes.
     """
 
-
-    dsub = dsIn.sel(Time=slice(start_time, end_time))
-    tare_vals = dsub.mean(dim='Time')
-
-    dsOut = dsIn - tare_vals    
-
-    if 'tare_values' in dsIn.attrs:
-        tv = dsIn.attrs['tare_values']
-    else:
-        tv = {}
-            
-    for name, val in tare_vals.data_vars.items():
-        tv.update({name: val.item()})
-    
-    dsOut.attrs['tare_values'] = tv
-
-    return dsOut
+    return _set_tare(dsIn, None, start_time, end_time, mode)
 
 # ==============================================================================
 
-def set_probe_tare(dsIn: xr.Dataset, probe, start_time, end_time):
+def set_probe_tare(dsIn: xr.Dataset, probe, start_time, end_time, mode = 'copy'):
     """
     Tare specified probes in the dataset using the mean value over a specified time range.
     
@@ -102,6 +226,10 @@ def set_probe_tare(dsIn: xr.Dataset, probe, start_time, end_time):
         - Start time for calculating tare values.
     - end_time : datetime-like
         - End time for calculating tare values.
+    - mode : str, optional
+        - 'copy', 'inplace' or 'lazy', see `set_all_probe_tare`. Default is 'copy'.
+        In 'copy' mode only the tared probes are new arrays, the other 
+        probes are shared with dsIn.
     
     Returns
     -------
@@ -109,7 +237,7 @@ def set_probe_tare(dsIn: xr.Dataset, probe, start_time, end_time):
         - Dataset with tare values subtracted from specified probes. Tare values for each 
         probe are stored in the dataset's `tare_values` attribute as a dictionary. If 
         `tare_values` already exists in the input dataset attributes, new tare values 
-        are added to the existing dictionary.    
+        are added to a copy of the existing dictionary.    
 
     Example
     -------
@@ -118,34 +246,131 @@ def set_probe_tare(dsIn: xr.Dataset, probe, start_time, end_time):
         >>> set_probe_tare(ds, 'WG01', start_time=0, end_time=0.5)   
     """
 
+    if(isinstance(probe, str)):
+        probe = [probe]    
+
+    return _set_tare(dsIn, probe, start_time, end_time, mode)
+
+# ==============================================================================
 
-    dsub = dsIn.sel(Time=slice(start_time, end_time))
-    tare_vals = dsub.mean(dim='Time')
+def apply_tare(dsIn, probe = None):
+    """
+    Apply the tare stored by the 'lazy' mode of `set_all_probe_tare` / `set_probe_tare`.
 
-    dsOut = dsIn.copy()
+    Parameters
+    ----------
+    - dsIn : xarray.Dataset
+        - Dataset with `tare_offset` attributes on its variables.
+    - probe : str, optional
+        - Only return this probe, so only this probe is copied. 
+        Default is the full dataset.
     
-    if(isinstance(probe, str)):
-        probe = [probe]    
+    Returns
+    -------
+    - xarray.DataArray or xarray.Dataset
+        - Tared probe, or dataset with all offsets subtracted.
 
-    if 'tare_values' in dsIn.attrs:
-        tv = dsIn.attrs['tare_values']
+    Example
+    -------
+
+        >>> ds = set_all_probe_tare(ds, 0, 2, mode='lazy')
+        >>> wg01 = apply_tare(ds, 'WG01')
+    """
+
+    if probe is not None:
+        return _subtract_offset(dsIn[probe])
+
+    dsOut = dsIn.copy(deep=False)
+    for name, da in dsIn.data_vars.items():
+        if 'tare_offset' in da.attrs:
+            dsOut[name] = _subtract_offset(da)
+    return dsOut
+
+# ==============================================================================
+
+def _set_tare(dsIn, probe, start_time, end_time, mode):
+    """Common part of `set_all_probe_tare` and `set_probe_tare`."""
+
+    if mode not in ('copy', 'inplace', 'lazy'):
+        raise ValueError(f"Unknown tare mode {mode}, use 'copy', 'inplace' or 'lazy'")
+
+    names = list(dsIn.data_vars) if probe is None else probe
+
+    with skb_profiling.stage("tare", dsIn[names].nbytes):
+        dsub = dsIn[names].sel(Time=slice(start_time, end_time))
+        # Only reads the tare window of dask backed data. The mean is 
+        # accumulated in float64, also for float32 probes
+        tare_vals = dsub.mean(dim='Time', dtype=np.float64).compute()
+
+    # Tare values in the dtype of each probe, so float32 probes stay float32
+    tare_cast = tare_vals.copy()
+    for name in names:
+        if dsIn[name].dtype.kind == 'f':
+            tare_cast[name] = tare_vals[name].astype(dsIn[name].dtype)
+
+    if mode == 'copy':
+        if probe is None:
+            dsOut = dsIn - tare_cast
+        else:
+            dsOut = dsIn.copy(deep=False)
+            for iprobe in probe:
+                dsOut[iprobe] = dsIn[iprobe] - tare_cast[iprobe]
+    elif mode == 'inplace':
+        dsOut = dsIn
+        for name in names:
+            var = dsIn[name].variable
+            if isinstance(var.data, np.ndarray):
+                var.data -= _expand_offset(tare_vals[name].values, var)
+            else:
+                # e.g. dask arrays: stays lazy, no in-place update possible
+                dsIn[name] = dsIn[name] - tare_cast[name]
     else:
-        tv = {}
-    
-    for iprobe in probe:
-        dsOut[iprobe] = dsIn[iprobe] - tare_vals[iprobe]
-        tv.update({iprobe: tare_vals[iprobe].item()})
+        dsOut = dsIn.copy(deep=False)
+        for name in names:
+            dsOut[name].attrs['tare_offset'] = tare_vals[name].values
+
+    # Never share the dictionary with dsIn
+    tv = dict(dsIn.attrs.get('tare_values', {}))
+    for name, val in tare_vals.data_vars.items():
+        if val.ndim == 0:
+            tv.update({name: val.item()})
+        else:
+            # stacked (probe, Time) layout
+            tv.update(zip(val[val.dims[0]].values.tolist(), val.values.tolist()))
 
+    dsOut.attrs = dict(dsOut.attrs)
     dsOut.attrs['tare_values'] = tv
 
     return dsOut
 
+def _expand_offset(offset, da):
+    """Tare offset with a length 1 Time axis, to broadcast against `da`.
+
+    The offset has the dimensions of `da` without Time, in the same order,
+    e.g. (probe,) for the stacked (probe, Time) layout.
+    """
+
+    return np.expand_dims(np.asarray(offset), da.get_axis_num('Time'))
+
+def _subtract_offset(da):
+    """Subtract the `tare_offset` attribute of a variable, if any."""
+
+    if 'tare_offset' not in da.attrs:
+        return da
+    offset = _expand_offset(da.attrs['tare_offset'], da)
+    if da.dtype.kind == 'f':
+        offset = offset.astype(da.dtype)
+    daOut = da - offset
+    daOut.attrs = {k: v for k, v in da.attrs.items() if k != 'tare_offset'}
+    return daOut
+
 # ==============================================================================
 
 def sync_signals_crosscorr_downsample( da1 : xr.DataArray, fSampling1, da2 : xr.DataArray, fSampling2, plotflag = False):
     """
     Synchronize two signals using cross-correlation.
-    If the sampling frequencies differ, downsample both signals to the minimum frequency.
+    If the sampling frequencies differ, downsample both signals to the minimum frequency
+    with `resample_to`.
     
     Parameters
     ----------
@@ -167,34 +392,27 @@ def sync_signals_crosscorr_downsample( da1 : xr.DataArray, fSampling1, da2 : xr.
     """
 
     
-    # Convert Time from Float64 to timedelta64[ns] to enable resampling
-    da1_resampled = da1.assign_coords(
-        Time_ns = (da1.Time * 1e9).astype('timedelta64[ns]') )
-    da2_resampled = da2.assign_coords(
-        Time_ns = (da2.Time * 1e9).astype('timedelta64[ns]') )
+    da1_resampled = da1
+    da2_resampled = da2
     
     fSampling = fSampling1 # Default    
 
     if fSampling1 != fSampling2:
         fSampling = min(fSampling1, fSampling2)
         dt_ns = 1/fSampling*1e9 # in ns
-        print(f"Warning: Sampling frequencies differ. Using minimum: {fSampling} Hz, dt = {dt_ns} ns")
+        logger.warning("Sampling frequencies differ. Using minimum: %s Hz, dt = %s ns", fSampling, dt_ns)
 
         if fSampling1 != fSampling:                                            
-            da1_resampled = da1_resampled.resample(Time_ns=f'{dt_ns}ns').mean()
-            da1_resampled = da1_resampled.assign_coords(
-                Time = (da1_resampled.Time_ns / np.timedelta64(1, 's')).astype('float64') )
+            da1_resampled = resample_to(da1, fSampling, fSampling=fSampling1)
 
         if fSampling2 != fSampling:    
-            da2_resampled = da2_resampled.resample(Time_ns=f'{dt_ns}ns').mean()
-            da2_resampled = da2_resampled.assign_coords(
-                Time = (da2_resampled.Time_ns / np.timedelta64(1, 's')).astype('float64') )
+            da2_resampled = resample_to(da2, fSampling, fSampling=fSampling2)
     
 
     dt = 1/fSampling
 
-    sig1 = da1_resampled.values
-    sig2 = da2_resampled.values
+    sig1 = np.asarray(da1_resampled.values, dtype=np.float64)
+    sig2 = np.asarray(da2_resampled.values, dtype=np.float64)
 
     n1 = len(sig1)
     n2 = len(sig2)
@@ -203,8 +421,9 @@ def sync_signals_crosscorr_downsample( da1 : xr.DataArray, fSampling1, da2 : xr.
     sig1 = sig1[0:N]
     sig2 = sig2[0:N]
 
-    corr = sp.signal.correlate(sig1 - np.mean(sig1), sig2 - np.mean(sig2), mode='full')
-    lags = sp.signal.correlation_lags(N, N, mode='full')
+    with skb_profiling.stage("correlation", sig1.nbytes + sig2.nbytes):
+        corr = sp.signal.correlate(sig1 - np.mean(sig1), sig2 - np.mean(sig2), mode='full')
+        lags = sp.signal.correlation_lags(N, N, mode='full')
 
     lag_maxCorr = lags[np.argmax(corr)]
     tShift_maxCorr = lag_maxCorr * dt
@@ -212,10 +431,12 @@ def sync_signals_crosscorr_downsample( da1 : xr.DataArray, fSampling1, da2 : xr.
     lag_mat_peaks, _ = sp.signal.find_peaks(corr, 
         height=np.max(corr)*0.9)
     tShift_array = lags[lag_mat_peaks]*dt
-    print(f"Peaks in cross-corr: {tShift_array}")
+    logger.info("Peaks in cross-corr: %s", tShift_array)
 
 
     if(plotflag):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 4))
         # da1_use.plot(x='Time', label='Signal 1')
         # da2_use.plot(x='Time', label='Signal 2')
@@ -279,21 +500,22 @@ def sync_signals_crosscorr_upsample( da1 : xr.DataArray, fSampling1, da2 : xr.Da
     if fSampling1 != fSampling2:
         fSampling = max(fSampling1, fSampling2)        
         dt = 1/fSampling
-        print(f"Warning: Sampling frequencies differ. Using maximum: {fSampling} Hz, dt = {dt} ns")        
+        logger.warning("Sampling frequencies differ. Using maximum: %s Hz, dt = %s ns", fSampling, dt)
 
-        if fSampling1 != fSampling:                                            
-            tArray = np.arange(da1.Time.min(), da1.Time.max(), 1/fSampling)
-            da1_use = da1.interp(Time=tArray, method = 'linear')
+        with skb_profiling.stage("resample"):
+            if fSampling1 != fSampling:                                            
+                tArray = np.arange(da1.Time.min(), da1.Time.max(), 1/fSampling)
+                da1_use = da1.interp(Time=tArray, method = 'linear')
 
-        if fSampling2 != fSampling:    
-            tArray = np.arange(da2.Time.min(), da2.Time.max(), 1/fSampling)
-            da2_use = da2.interp(Time=tArray, method = 'linear')
+            if fSampling2 != fSampling:    
+                tArray = np.arange(da2.Time.min(), da2.Time.max(), 1/fSampling)
+                da2_use = da2.interp(Time=tArray, method = 'linear')
     
 
     dt = 1/fSampling
 
-    sig1 = da1_use.values
-    sig2 = da2_use.values
+    sig1 = np.asarray(da1_use.values, dtype=np.float64)
+    sig2 = np.asarray(da2_use.values, dtype=np.float64)
 
     n1 = len(sig1)
     n2 = len(sig2)
@@ -302,8 +524,9 @@ def sync_signals_crosscorr_upsample( da1 : xr.DataArray, fSampling1, da2 : xr.Da
     sig1 = sig1[0:N]
     sig2 = sig2[0:N]
 
-    corr = sp.signal.correlate(sig1 - np.mean(sig1), sig2 - np.mean(sig2), mode='full')
-    lags = sp.signal.correlation_lags(N, N, mode='full')
+    with skb_profiling.stage("correlation", sig1.nbytes + sig2.nbytes):
+        corr = sp.signal.correlate(sig1 - np.mean(sig1), sig2 - np.mean(sig2), mode='full')
+        lags = sp.signal.correlation_lags(N, N, mode='full')
 
     lag_maxCorr = lags[np.argmax(corr)]
     tShift_maxCorr = lag_maxCorr * dt
@@ -311,10 +534,12 @@ def sync_signals_crosscorr_upsample( da1 : xr.DataArray, fSampling1, da2 : xr.Da
     lag_mat_peaks, _ = sp.signal.find_peaks(corr, 
         height=np.max(corr)*0.9)
     tShift_array = lags[lag_mat_peaks]*dt
-    print(f"Peaks in cross-corr: {tShift_array}")
+    logger.info("Peaks in cross-corr: %s", tShift_array)
 
 
     if(plotflag):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 4))
         # da1_use.plot(x='Time', label='Signal 1')
         # da2_use.plot(x='Time', label='Signal 2')
@@ -341,4 +566,507 @@ def sync_signals_crosscorr_upsample( da1 : xr.DataArray, fSampling1, da2 : xr.Da
     return tShift_maxCorr, tShift_array
 
 
-     
\ No newline at end of file
+# ==============================================================================
+
+def sync_signals_crosscorr_bounded( da1 : xr.DataArray, fSampling1, da2 : xr.DataArray, fSampling2, max_lag, refine = 'parabolic', plotflag = False):
+    """
+    Synchronize two signals using cross-correlation over a bounded lag window.
+
+    Only lags within +-max_lag are computed, with one FFT of length 
+    N + max_lag instead of the 2N-1 lags of the full correlation. 
+    The peak is refined to sub-sample precision, so there is no need to 
+    upsample the signals. If the sampling frequencies differ, the faster 
+    signal is resampled to the slower one with a polyphase filter.
+    
+    Parameters
+    ----------
+    - da1 : xr.DataArray
+        - First signal to be synchronized.
+    - fSampling1 : float
+        - Sampling frequency of the first signal (in Hz).    
+    - da2 : xr.DataArray
+        - Second signal to be synchronized.
+    - fSampling2 : float
+        - Sampling frequency of the second signal (in Hz).
+    - max_lag : float
+        - Largest time shift searched (in s), in both directions.
+    - refine : str, optional
+        - Sub-sample refinement of the peak: 'parabolic' or None. Default is 'parabolic'.
+    - plotflag : bool, optional
+        - If True, plot the cross-correlation result. Default is False.
+    
+    Returns
+    -------
+    - float
+        - Time shift to apply to ds2 to synchronize with ds1.
+    - ndarray
+        - Time shifts of all cross-correlation peaks above 0.9 of the maximum.
+    """
+
+    sig1, sig2, fSampling = _get_common_rate_signals(
+        np.asarray(da1.values, dtype=np.float64), fSampling1,
+        np.asarray(da2.values, dtype=np.float64), fSampling2)
+    dt = 1/fSampling
+
+    lags, corr = _crosscorr_bounded(sig1, sig2, int(np.ceil(max_lag * fSampling)))
+
+    iMax = np.argmax(corr)
+    tShift_maxCorr = _refine_peak(lags, corr, iMax, refine) * dt
+
+    lag_mat_peaks, _ = sp.signal.find_peaks(corr, 
+        height=np.max(corr)*0.9)
+    tShift_array = lags[lag_mat_peaks]*dt
+
+    if(plotflag):
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(10, 4))
+        plt.plot(lags * dt, corr)
+        plt.scatter(tShift_array, corr[lag_mat_peaks], color='orange', label='Peaks')
+        plt.title('Cross-correlation between signals')
+        plt.xlabel('Lag (s)')
+        plt.ylabel('Correlation coefficient')
+        plt.axvline(x=tShift_maxCorr, color='r', linestyle='--', label=f'Max corr at Shift: {tShift_maxCorr:.4f} s')
+        plt.legend()
+        plt.grid()
+        plt.show()
+
+    return tShift_maxCorr, tShift_array
+
+
+# ==============================================================================
+
+def resample_to(dsIn, fs_target, fSampling = None, dtype = None):
+    """
+    Resample a Dataset or DataArray to a new sampling frequency.
+
+    Uses a polyphase anti-aliasing filter (`scipy.signal.resample_poly`) on
+    all variables along Time at once. The rate ratio is approximated by a 
+    fraction with a denominator up to 1000, e.g. 2048 Hz -> 2000 Hz is 
+    exactly 125/128. The new Time coordinate is built from the first time 
+    and the exact output step, not from the resampled input times.
+    
+    Parameters
+    ----------
+    - dsIn : xr.Dataset or xr.DataArray
+        - Input data with a uniformly sampled 'Time' dimension.
+    - fs_target : float
+        - Target sampling frequency (in Hz).
+    - fSampling : float, optional
+        - Sampling frequency of dsIn (in Hz). Default is estimated from Time.
+    - dtype : dtype, optional
+        - dtype of the resampled variables. The filter always runs in float64.
+        Default is the dtype of each variable (float64 for integers).
+    
+    Returns
+    -------
+    - xr.Dataset or xr.DataArray
+        - Resampled data. Variables without a Time dimension are kept as-is.
+
+    Example
+    -------
+
+        >>> ds100 = resample_to(ds, 100, fSampling=2000)
+    """
+
+    t = dsIn['Time'].values
+    if fSampling is None:
+        fSampling = 1 / np.median(np.diff(t))
+
+    ratio = Fraction(fs_target / fSampling).limit_denominator(1000)
+    up, down = ratio.numerator, ratio.denominator
+
+    if isinstance(dsIn, xr.DataArray):
+        ds = dsIn.to_dataset(name='_data')
+    else:
+        ds = dsIn
+
+    names = [k for k, v in ds.data_vars.items() if 'Time' in v.dims]
+    vecs = [k for k in names if ds[k].ndim == 1]
+    others = [k for k in names if ds[k].ndim > 1]
+
+    def out_dtype(k):
+        if dtype is not None:
+            return np.dtype(dtype)
+        return ds[k].dtype if ds[k].dtype.kind == 'f' else np.dtype(np.float64)
+
+    out = {}
+    with skb_profiling.stage("resample") as st:
+        if vecs:
+            # All 1D variables in one (variable, Time) call
+            data = np.stack([ds[k].values for k in vecs]).astype(np.float64, copy=False)
+            st.nbytes += data.nbytes
+            data = sp.signal.resample_poly(data, up, down, axis=-1, padtype='line')
+            for k, row in zip(vecs, data):
+                out[k] = ('Time', row.astype(out_dtype(k), copy=False), ds[k].attrs)
+        for k in others:
+            da = ds[k].transpose(..., 'Time')
+            st.nbytes += da.nbytes
+            data = sp.signal.resample_poly(
+                np.asarray(da.values, dtype=np.float64), up, down, axis=-1, padtype='line')
+            out[k] = (da.dims, data.astype(out_dtype(k), copy=False), da.attrs)
+
+    nOut = len(next(iter(out.values()))[1].T) if out else int(np.ceil(len(t) * up / down))
+    tOut = t[0] + np.arange(nOut) * (down / (up * fSampling))
+
+    dsOut = ds.drop_vars(names + [c for c in ds.coords if 'Time' in ds[c].dims])
+    dsOut = dsOut.assign_coords(Time=tOut).assign(out)
+
+    if isinstance(dsIn, xr.DataArray):
+        daOut = dsOut['_data'].rename(dsIn.name)
+        daOut.attrs = dict(dsIn.attrs)
+        return daOut
+
+    dsOut.attrs = dict(dsIn.attrs)
+    return dsOut
+
+
+# ==============================================================================
+
+def sync_cases( dsRef : xr.Dataset, fSamplingRef, dsList, fSamplingList, probe = 'WG01', tmin = None, tmax = None, max_lag = 5.0, names = None, max_workers = None):
+    """
+    Synchronize many cases (e.g. repeat tests) to a reference case.
+
+    The time shifts of all cases and probes are computed concurrently with 
+    `sync_signals_crosscorr_bounded`'s engine in a thread pool. The shifts 
+    are applied as an offset of the Time coordinate, the probe data is not 
+    copied.
+    
+    Parameters
+    ----------
+    - dsRef : xr.Dataset
+        - Reference case.
+    - fSamplingRef : float
+        - Sampling frequency of the reference case (in Hz).
+    - dsList : list of xr.Dataset
+        - Cases to synchronize with the reference.
+    - fSamplingList : float or list of float
+        - Sampling frequency of each case (in Hz).
+    - probe : str or list of str, optional
+        - Probe(s) used for the cross-correlation. With several probes the 
+        median shift is applied. Default is 'WG01'.
+    - tmin, tmax : float, optional
+        - Time window used for the cross-correlation. Default is the full record.
+    - max_lag : float, optional
+        - Largest time shift searched (in s). Default is 5.
+    - names : list of str, optional
+        - Names of the cases in the table. Default is the position in dsList.
+    - max_workers : int, optional
+        - Number of threads. Default from `concurrent.futures`.
+    
+    Returns
+    -------
+    - list of xr.Dataset
+        - Shifted cases, with the applied shift in the `TimeShiftApplied` attribute.
+    - pandas.DataFrame
+        - One row per case and probe with the time shift `tShift` and the
+        normalized cross-correlation peak `corrMax` (1 for a perfect match).
+
+    Example
+    -------
+
+        >>> dsList, table = sync_cases(ds1, 2000, [ds2, ds3], 2000, probe='WG01', tmin=30, tmax=80)
+    """
+
+    if isinstance(probe, str):
+        probe = [probe]
+    if np.isscalar(fSamplingList):
+        fSamplingList = [fSamplingList] * len(dsList)
+    if names is None:
+        names = list(range(len(dsList)))
+
+    jobs = [(i, p) for i in range(len(dsList)) for p in probe]
+
+    def get_shift(job):
+        i, p = job
+        return _get_time_shift(
+            dsRef[p].sel(Time=slice(tmin, tmax)), fSamplingRef,
+            dsList[i][p].sel(Time=slice(tmin, tmax)), fSamplingList[i],
+            max_lag)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(get_shift, jobs))
+
+    table = pd.DataFrame(
+        [(names[i], p, tShift, corrMax) for (i, p), (tShift, corrMax) in zip(jobs, results)],
+        columns=['case', 'probe', 'tShift', 'corrMax'])
+
+    dsOut = []
+    for i, ds in enumerate(dsList):
+        tShift = float(np.median([r[0] for (j, _), r in zip(jobs, results) if j == i]))
+        ds = ds.assign_coords(Time=ds['Time'] + tShift)
+        ds.attrs['TimeShiftApplied'] = tShift
+        dsOut.append(ds)
+
+    return dsOut, table
+
+
+# ==============================================================================
+
+def get_peak_table(dsIn, windows = None, probes = None, height = None, prominence = None, distance = None, rise_fraction = (0.1, 0.9), impulse_rel_height = 1.0, case = None, batch_size = 2**20):
+    """
+    Peak table of many probes over a list of time windows.
+
+    The windows of all probes are concatenated into batches of about 
+    `batch_size` samples, separated by `+inf` gaps, so peaks, prominences, 
+    rise times and impulses are found with one call of each `scipy.signal` 
+    routine per batch instead of one xarray call per probe and window. 
+    The gaps are higher than any sample, so a peak search never crosses 
+    from one probe or window into the next.
+    Lazy tare offsets (`set_all_probe_tare(..., mode='lazy')`) are applied.
+    
+    Parameters
+    ----------
+    - dsIn : xr.Dataset
+        - Case with 'Time' and the probe variables, or the stacked 'probes' variable.
+    - windows : list of (tmin, tmax), optional
+        - Time windows to search (in s). None bounds are open. Default is the full record.
+    - probes : list of str, optional
+        - Probes to search. Default is all WG and PS probes.
+    - height : float, optional
+        - Minimum peak value.
+    - prominence : float, optional
+        - Minimum peak prominence.
+    - distance : float, optional
+        - Minimum time between peaks of the same probe (in s).
+    - rise_fraction : (float, float), optional
+        - Fractions of the prominence between which the rise time is 
+        measured, on the rising flank. Default is (0.1, 0.9).
+    - impulse_rel_height : float, optional
+        - The impulse is the time integral of the signal over the peak width 
+        at this fraction of the prominence below the peak (1 is the base of 
+        the peak, 0.5 the half-prominence width). Default is 1.
+    - case : str, optional
+        - Added as a 'case' column, to concatenate the tables of many cases.
+    - batch_size : int, optional
+        - Approximate number of samples searched at once. Default is 2**20.
+    
+    Returns
+    -------
+    - pandas.DataFrame
+        - One row per peak with columns probe, window, tmin, tmax, time, 
+        value, prominence, rise_time, impulse (and case if given).
+
+    Example
+    -------
+
+        >>> table = get_peak_table(ds, windows=[(40, 45), (60, 65)], probes=['PS01', 'PS02'], prominence=50)
+        >>> table.groupby('probe')['value'].max()
+    """
+
+    if windows is None:
+        windows = [(None, None)]
+    if probes is None:
+        if 'probes' in dsIn.data_vars and dsIn['probes'].ndim == 2:
+            names = dsIn['probe'].values.tolist()
+        else:
+            names = list(dsIn.data_vars)
+        probes = [p for p in names if p.startswith(('WG', 'PS'))]
+
+    t = dsIn['Time'].values
+    dt = float(np.median(np.diff(t)))
+    values = _get_probe_values(dsIn, probes)
+
+    # (window, probe, first sample, last sample + 1) of each segment
+    segments = []
+    for iw, (tmin, tmax) in enumerate(windows):
+        i0 = 0 if tmin is None else np.searchsorted(t, tmin, side='left')
+        i1 = len(t) if tmax is None else np.searchsorted(t, tmax, side='right')
+        if i1 > i0:
+            segments.extend((iw, ip, i0, i1) for ip in range(len(probes)))
+
+    batches = [[]]
+    nBatch = 0
+    for seg in segments:
+        if batches[-1] and nBatch + (seg[3] - seg[2]) > batch_size:
+            batches.append([])
+            nBatch = 0
+        batches[-1].append(seg)
+        nBatch += seg[3] - seg[2]
+
+    kwargs = dict(height=height, prominence=prominence, distance=distance,
+        rise_fraction=rise_fraction, impulse_rel_height=impulse_rel_height)
+    with skb_profiling.stage("peaks", values.nbytes):
+        peaks = [_get_peaks_batch(values, t, dt, batch, **kwargs) 
+            for batch in batches if batch]
+
+    columns = ['iWin', 'iProbe', 'time', 'value', 'prominence', 'rise_time', 'impulse']
+    if peaks:
+        found = {c: np.concatenate([pk[c] for pk in peaks]) for c in columns}
+    else:
+        found = {c: np.empty(0) for c in columns}
+    iWin = found['iWin'].astype(int)
+
+    table = pd.DataFrame({
+        'probe': np.array(probes, dtype=object)[found['iProbe'].astype(int)],
+        'window': iWin,
+        'tmin': [windows[k][0] for k in iWin],
+        'tmax': [windows[k][1] for k in iWin],
+        'time': found['time'],
+        'value': found['value'],
+        'prominence': found['prominence'],
+        'rise_time': found['rise_time'],
+        'impulse': found['impulse'] })
+    if case is not None:
+        table.insert(0, 'case', case)
+
+    return table
+
+
+# ==============================================================================
+
+def _get_peaks_batch(values, t, dt, segments, height, prominence, distance, rise_fraction, impulse_rel_height):
+    """Peaks of a batch of (window, probe) segments, searched as one signal."""
+
+    nGap = 1 if distance is None else 2 * int(np.ceil(distance / dt)) + 1
+
+    parts = []
+    times = []
+    starts = []
+    pos = 0
+    for (_, ip, i0, i1) in segments:
+        parts.extend([values[ip, i0:i1], np.full(nGap, np.inf)])
+        times.extend([t[i0:i1], np.full(nGap, np.nan)])
+        starts.append(pos)
+        pos += (i1 - i0) + nGap
+    x = np.concatenate(parts).astype(np.float64, copy=False)
+    tAll = np.concatenate(times)
+
+    # The gaps are peaks too: bound their prominence search with wlen, which 
+    # does not change the other peaks since their search stops at the gaps
+    wlen = 2 * max(len(p) for p in parts) + 3
+    iPeak, _ = sp.signal.find_peaks(x, height=height, prominence=prominence,
+        distance=None if distance is None else max(distance / dt, 1), wlen=wlen)
+    iPeak = iPeak[np.isfinite(x[iPeak])]
+
+    prom = sp.signal.peak_prominences(x, iPeak)
+
+    # Rise time: crossings of the rising flank at the two fractions
+    lo = sp.signal.peak_widths(x, iPeak, rel_height=1 - rise_fraction[0], prominence_data=prom)
+    hi = sp.signal.peak_widths(x, iPeak, rel_height=1 - rise_fraction[1], prominence_data=prom)
+    rise_time = _interp_index(tAll, hi[2]) - _interp_index(tAll, lo[2])
+
+    # Impulse: trapezoidal time integral, the gaps add nothing
+    dtAll = np.diff(tAll)
+    dtAll[np.isnan(dtAll)] = 0.0
+    y = np.where(np.isinf(x), 0.0, x)
+    cumInt = np.concatenate([[0.0], np.cumsum(0.5 * (y[1:] + y[:-1]) * dtAll)])
+    width = sp.signal.peak_widths(x, iPeak, rel_height=impulse_rel_height, prominence_data=prom)
+    impulse = _interp_index(cumInt, width[3]) - _interp_index(cumInt, width[2])
+
+    iSeg = np.searchsorted(starts, iPeak, side='right') - 1
+    segments = np.array([seg[:2] for seg in segments]).reshape(-1, 2)
+
+    return {
+        'iWin': segments[iSeg, 0],
+        'iProbe': segments[iSeg, 1],
+        'time': tAll[iPeak],
+        'value': x[iPeak],
+        'prominence': prom[0],
+        'rise_time': rise_time,
+        'impulse': impulse }
+
+
+# ==============================================================================
+
+def _get_probe_values(dsIn, probes):
+    """Probe signals as a 2D (probe, Time) array, with lazy tare offsets applied."""
+
+    if 'probes' in dsIn.data_vars and dsIn['probes'].ndim == 2:
+        da = _subtract_offset(dsIn['probes']).sel(probe=probes)
+        return da.transpose('probe', 'Time').values
+
+    values = np.empty((len(probes), dsIn.sizes['Time']),
+        dtype=np.result_type(*[dsIn[p].dtype for p in probes]) if probes else np.float64)
+    for i, p in enumerate(probes):
+        values[i] = _subtract_offset(dsIn[p]).values
+    return values
+
+
+def _interp_index(arr, pos):
+    """Linear interpolation of arr at fractional sample positions."""
+
+    i = np.clip(np.floor(pos).astype(int), 0, len(arr) - 2)
+    frac = pos - i
+    out = arr[i]
+    # Exact sample positions must not read the next (maybe gap) sample
+    m = frac > 0
+    out[m] += frac[m] * (arr[i[m] + 1] - arr[i[m]])
+    return out
+
+# ==============================================================================
+
+def _get_time_shift(da1, fSampling1, da2, fSampling2, max_lag, refine='parabolic'):
+    """Time shift to apply to da2 and the normalized correlation peak."""
+
+    sig1, sig2, fSampling = _get_common_rate_signals(
+        np.asarray(da1.values, dtype=np.float64), fSampling1,
+        np.asarray(da2.values, dtype=np.float64), fSampling2)
+
+    lags, corr = _crosscorr_bounded(sig1, sig2, int(np.ceil(max_lag * fSampling)))
+    iMax = np.argmax(corr)
+
+    return _refine_peak(lags, corr, iMax, refine) / fSampling, float(corr[iMax])
+
+
+# ==============================================================================
+
+def _get_common_rate_signals(sig1, fSampling1, sig2, fSampling2):
+    """Resample the faster signal to the slower rate, then cut both to the same length."""
+
+    fSampling = min(fSampling1, fSampling2)
+    if fSampling1 != fSampling:
+        sig1 = _resample_signal(sig1, fSampling1, fSampling)
+    if fSampling2 != fSampling:
+        sig2 = _resample_signal(sig2, fSampling2, fSampling)
+
+    N = min(len(sig1), len(sig2))
+    return sig1[:N], sig2[:N], fSampling
+
+
+def _resample_signal(sig, fFrom, fTo, axis=-1):
+    """Polyphase resampling with the rational approximation of fTo/fFrom."""
+
+    ratio = Fraction(fTo / fFrom).limit_denominator(1000)
+    return sp.signal.resample_poly(sig, ratio.numerator, ratio.denominator, axis=axis)
+
+
+def _crosscorr_bounded(sig1, sig2, max_lag):
+    """Normalized cross-correlation of sig1 and sig2 for lags -max_lag..max_lag.
+
+    Same convention as `scipy.signal.correlate(sig1, sig2)`: a positive lag 
+    means sig1 is delayed with respect to sig2.
+    """
+
+    N = len(sig1)
+    max_lag = min(max_lag, N - 1)
+
+    sig1 = sig1 - np.mean(sig1)
+    sig2 = sig2 - np.mean(sig2)
+
+    # Circular correlation without wrap-around for |lag| <= max_lag
+    nfft = sp.fft.next_fast_len(N + max_lag, real=True)
+    with skb_profiling.stage("correlation", sig1.nbytes + sig2.nbytes):
+        corr = sp.fft.irfft(
+            sp.fft.rfft(sig1, nfft) * np.conj(sp.fft.rfft(sig2, nfft)), nfft)
+    corr = np.concatenate((corr[nfft - max_lag:], corr[:max_lag + 1]))
+
+    norm = np.sqrt(np.sum(sig1**2) * np.sum(sig2**2))
+    if norm > 0:
+        corr /= norm
+
+    return np.arange(-max_lag, max_lag + 1), corr
+
+
+def _refine_peak(lags, corr, iMax, refine):
+    """Lag of the correlation peak, refined by a parabola through 3 points."""
+
+    if (refine is None) or (iMax == 0) or (iMax == len(corr) - 1):
+        return float(lags[iMax])
+    if refine != 'parabolic':
+        raise ValueError(f"Unknown refine method {refine}, use 'parabolic' or None")
+
+    ym, y0, yp = corr[iMax - 1], corr[iMax], corr[iMax + 1]
+    denom = ym - 2*y0 + yp
+    delta = 0.5 * (ym - yp) / denom if denom != 0 else 0.0
+    return float(lags[iMax]) + delta
@@ -0,0 +1,348 @@
+"""Min/max decimation pyramid for plotting long records.
+
+A full 2000 Hz record has hundreds of thousands of samples per probe, far more
+than the pixels of a plot. `build_pyramid` reduces each probe to the minimum
+and maximum of bins of `base`, `base * factor`, `base * factor**2`, ...
+samples. Each level is a Dataset on its own Time coordinate with two points per
+bin (the extremes in the order they occur), so a line plot of a level draws the
+same envelope as the full record as long as a bin is narrower than a pixel.
+
+`plot_preview` picks the coarsest level that still has two points per pixel of
+the visible time range and switches level (down to the raw samples) when the
+axis is zoomed or panned:
+
+    >>> case = skb.io.load_case(file, cache=True)
+    >>> pyramid = load_preview(file)
+    >>> ax = plot_preview(case["DefaultData"], "WG01", pyramid=pyramid)
+
+`load_preview` keeps the pyramid of a case in a Zarr store next to the MAT
+file (Test171.preview.zarr), or in the preview cache directory when the data
+folder is read-only, rebuilt when the MAT file changes. It requires the
+optional `zarr` dependency.
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from . import cache as skb_cache
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+
+def build_pyramid(ds: xr.Dataset, probes=None, base=8, factor=4,
+    min_bins=1024) -> list:
+    """
+    Min/max decimation pyramid of the probes of a Dataset.
+
+    Args:
+    - ds: Dataset with a Time dimension, e.g. `case["DefaultData"]`. Dask
+        backed probes are computed one at a time.
+    - probes: Probes to decimate.
+        - Default value: all data variables along Time
+    - base: Samples per bin of the finest level.
+        - Default value: 8
+    - factor: Ratio of the bin sizes of two consecutive levels.
+        - Default value: 4
+    - min_bins: Levels with fewer bins are not built.
+        - Default value: 1024
+
+    Returns:
+    - list: One Dataset per level, finest first, with Time of length 2 * bins
+        and the attrs `bin_size` (samples per bin) and `level`.
+    """
+
+    if probes is None:
+        probes = [p for p in ds.data_vars if ds[p].dims == ("Time",)]
+    t = ds["Time"].values
+    n = t.size
+
+    bin_sizes = []
+    b = base
+    while -(-n // b) >= min_bins or not bin_sizes:
+        bin_sizes.append(b)
+        b *= factor
+
+    with skb_profiling.stage("pyramid") as st:
+        levels = [{} for _ in bin_sizes]
+        for p in probes:
+            x = np.asarray(ds[p].values, dtype=np.float64)
+            st.nbytes += x.nbytes
+            vmin, imin, vmax, imax = _get_bin_extremes(x, base)
+            for iLevel, b in enumerate(bin_sizes):
+                if iLevel > 0:
+                    vmin, imin, vmax, imax = _merge_bins(vmin, imin, vmax, imax, factor)
+                levels[iLevel].update({p: _interleave(vmin, imin, vmax, imax)})
+
+    pyramid = []
+    for iLevel, (b, data_vars) in enumerate(zip(bin_sizes, levels)):
+        start = np.arange(0, n, b)
+        mid = np.minimum(start + b // 2, n - 1)
+        time = np.column_stack([t[start], t[mid]]).reshape(-1)
+        pyramid.append(xr.Dataset(
+            {p: ("Time", v) for p, v in data_vars.items()},
+            coords={"Time": time},
+            attrs={"bin_size": b, "level": iLevel}))
+    return pyramid
+
+
+# ==============================================================================
+
+def load_preview(file, group="DefaultData", probes=None, *, cache_dir=None,
+    **pyramid_options) -> list:
+    """
+    Pyramid of a case, cached in a Zarr store, see `get_preview_path`.
+
+    The store is rebuilt when the size or mtime of the MAT file, the group or
+    the pyramid options changed.
+
+    Args:
+    - file: Path to the MAT file of the case.
+    - group: Time series group of the case.
+        - Default value: "DefaultData"
+    - probes: Probes to decimate.
+        - Default value: all probes of the group
+    - cache_dir: Directory of the preview store.
+        - Default value: next to the MAT file, or `get_preview_dir()` when
+            that folder is not writable
+    - pyramid_options: Passed to `build_pyramid` (base, factor, min_bins).
+
+    Returns:
+    - list: Levels of the pyramid, see `build_pyramid`. The levels are
+        opened lazily from the store.
+    """
+
+    from . import io as skb_io
+
+    file = Path(file)
+    store = get_preview_path(file, cache_dir)
+    st = file.stat()
+    key = {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns,
+        "group": group, "probes": ",".join(probes) if probes else "",
+        "options": ",".join(f"{k}={v}" for k, v in sorted(pyramid_options.items()))}
+
+    pyramid = _read_preview(store, key)
+    if pyramid is not None:
+        return pyramid
+
+    logger.info("Building preview of %s", file)
+    case = skb_io.load_case(file, groups=[group], probes=probes)
+    pyramid = build_pyramid(case[group], probes=probes, **pyramid_options)
+    _write_preview(store, pyramid, key)
+    return pyramid
+
+
+def get_preview_path(file, cache_dir=None) -> Path:
+    """
+    Path of the preview store of a MAT file.
+
+    Args:
+    - file: Path to the MAT file of the case.
+    - cache_dir: Directory of the store. The name of the store then has a
+        hash of the MAT file path, e.g. Test171_3f2a....preview.zarr, so
+        cases with the same name in different folders do not collide.
+        - Default value: next to the MAT file (Test171.preview.zarr), or
+            `get_preview_dir()` when that folder is not writable
+
+    Returns:
+    - Path: The Zarr store.
+    """
+
+    file = Path(file)
+    if cache_dir is None:
+        if os.access(file.parent, os.W_OK):
+            return file.with_name(f"{file.stem}.preview.zarr")
+        cache_dir = get_preview_dir()
+
+    key = hashlib.sha1(str(file.resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"{file.stem}_{key}.preview.zarr"
+
+
+def get_preview_dir() -> Path:
+    """
+    Default directory of the preview stores of read-only data folders, next
+    to the case cache.
+
+    Returns:
+    - Path of the preview directory.
+    """
+
+    return skb_cache.get_cache_dir().parent / "preview"
+
+
+# ==============================================================================
+
+def select_level(ds: xr.Dataset, pyramid: list, probe, tmin=None, tmax=None,
+    width=1000) -> xr.DataArray:
+    """
+    Probe data to draw the time range [tmin, tmax] on `width` pixels.
+
+    Returns the coarsest level with at least two points per pixel in the
+    range, or the raw samples of `ds` when no level is that fine.
+
+    Args:
+    - ds: Dataset with the raw samples of the probe.
+    - pyramid: Levels from `build_pyramid` or `load_preview`.
+    - probe: Name of the probe.
+    - tmin, tmax: Visible time range in s.
+        - Default value: the whole record
+    - width: Width of the plot in pixels.
+        - Default value: 1000
+
+    Returns:
+    - xr.DataArray: The probe in [tmin, tmax], with one bin of margin.
+    """
+
+    t = ds["Time"]
+    tmin = float(t[0]) if tmin is None else tmin
+    tmax = float(t[-1]) if tmax is None else tmax
+    dt = float(t[1] - t[0])
+    nVisible = max((tmax - tmin) / dt, 0.0)
+
+    for level in reversed(pyramid):
+        b = level.attrs["bin_size"]
+        if (nVisible / b >= width) and (probe in level):
+            margin = b * dt
+            return level[probe].sel(Time=slice(tmin - margin, tmax + margin))
+
+    return ds[probe].sel(Time=slice(tmin - dt, tmax + dt))
+
+
+# ==============================================================================
+
+def plot_preview(ds: xr.Dataset, probe, pyramid=None, ax=None, tmin=None,
+    tmax=None, width=None, **plot_kwargs):
+    """
+    Plot a probe through its pyramid, following zoom and pan of the axis.
+
+    Args:
+    - ds: Dataset with the raw samples, e.g. `case["DefaultData"]`. A lazy
+        (cache or dask) Dataset only reads the zoomed range.
+    - probe: Name of the probe.
+    - pyramid: Levels from `build_pyramid` or `load_preview`.
+        - Default value: built from `ds` for this probe
+    - ax: Matplotlib axis, reuse it to overlay probes or cases.
+        - Default value: a new figure
+    - tmin, tmax: Initial time range in s.
+        - Default value: the whole record
+    - width: Width of the plot in pixels.
+        - Default value: the width of the axis
+    - plot_kwargs: Passed to `ax.plot`, e.g. label or color.
+
+    Returns:
+    - Axes: The axis of the plot.
+    """
+
+    import matplotlib.pyplot as plt
+
+    if pyramid is None:
+        pyramid = build_pyramid(ds, probes=[probe])
+    if ax is None:
+        _, ax = plt.subplots()
+
+    def get_width():
+        if width is not None:
+            return width
+        return max(int(ax.get_window_extent().width), 1)
+
+    da = select_level(ds, pyramid, probe, tmin, tmax, get_width())
+    line, = ax.plot(da["Time"].values, da.values, **plot_kwargs)
+    ax.set_xlabel("Time")
+    if tmin is not None or tmax is not None:
+        ax.set_xlim(tmin, tmax)
+
+    def on_xlim_changed(ax):
+        lo, hi = ax.get_xlim()
+        da = select_level(ds, pyramid, probe, lo, hi, get_width())
+        line.set_data(da["Time"].values, da.values)
+        ax.figure.canvas.draw_idle()
+
+    ax.callbacks.connect("xlim_changed", on_xlim_changed)
+    return ax
+
+
+# ==============================================================================
+
+def _get_bin_extremes(x, b):
+    """Min, argmin, max and argmax of the bins of b samples of x.
+
+    The last bin is padded with its last sample. NaN are skipped, bins of
+    only NaN give NaN.
+    """
+
+    n = x.size
+    nBins = -(-n // b)
+    xb = np.concatenate([x, np.repeat(x[-1:], nBins * b - n)]).reshape(nBins, b)
+    offset = np.arange(nBins) * b
+    iMin = np.argmin(np.where(np.isnan(xb), np.inf, xb), axis=1)
+    iMax = np.argmax(np.where(np.isnan(xb), -np.inf, xb), axis=1)
+    rows = np.arange(nBins)
+    return (xb[rows, iMin], np.minimum(offset + iMin, n - 1),
+        xb[rows, iMax], np.minimum(offset + iMax, n - 1))
+
+
+def _merge_bins(vmin, imin, vmax, imax, factor):
+    """Extremes of the bins of `factor` consecutive bins."""
+
+    nBins = -(-vmin.size // factor)
+    pad = nBins * factor - vmin.size
+
+    def reshape(a):
+        return np.concatenate([a, np.repeat(a[-1:], pad)]).reshape(nBins, factor)
+
+    vmin, imin, vmax, imax = (reshape(a) for a in (vmin, imin, vmax, imax))
+    rows = np.arange(nBins)
+    jMin = np.argmin(np.where(np.isnan(vmin), np.inf, vmin), axis=1)
+    jMax = np.argmax(np.where(np.isnan(vmax), -np.inf, vmax), axis=1)
+    return (vmin[rows, jMin], imin[rows, jMin], vmax[rows, jMax], imax[rows, jMax])
+
+
+def _interleave(vmin, imin, vmax, imax):
+    """Two values per bin: the min and the max in the order they occur."""
+
+    minFirst = imin <= imax
+    first = np.where(minFirst, vmin, vmax)
+    second = np.where(minFirst, vmax, vmin)
+    return np.column_stack([first, second]).reshape(-1)
+
+
+def _read_preview(store: Path, key: dict):
+    """Levels of a preview store, None if it is missing or outdated."""
+
+    if not store.exists():
+        return None
+    try:
+        first = xr.open_zarr(store, group="level0", consolidated=False)
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+    if any(first.attrs.get(k) != v for k, v in key.items()):
+        return None
+
+    return [xr.open_zarr(store, group=f"level{i}", consolidated=False)
+        for i in range(first.attrs["nLevels"])]
+
+
+def _write_preview(store: Path, pyramid: list, key: dict):
+    """Write the levels to a temporary store and move it in place."""
+
+    store.parent.mkdir(parents=True, exist_ok=True)
+    tmp = store.with_name(f".{store.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    for level in pyramid:
+        level = level.copy(deep=False)
+        level.attrs.update(key)
+        level.attrs.update({"nLevels": len(pyramid)})
+        level.to_zarr(tmp, group=f"level{level.attrs['level']}", mode="a",
+            consolidated=False)
+
+    shutil.rmtree(store, ignore_errors=True)
+    os.replace(tmp, store)
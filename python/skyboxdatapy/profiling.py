@@ -0,0 +1,162 @@
+"""Stage timers, byte counters and logging setup of skyboxdatapy.
+
+The package reports through the standard `logging` module (logger
+"skyboxdatapy" and its children) and is silent by default. The hot paths are
+wrapped in named stages (hdf5_read, clean_attributes, xarray_build, fft,
+correlation, ...). The stages cost one flag check unless a `profile` is
+active, in which case their calls, time and bytes are accumulated:
+
+    >>> with skb.profiling.profile() as report:
+    ...     ds = skb.io.load_case(file)
+    ...     spec = skb.spec.get_spectra(ds["DefaultData"], 2000)
+    >>> report.to_frame()
+                      calls  seconds     bytes  MB/s
+    stage
+    hdf5_read             1    1.420  2.21e+08   155
+    ...
+
+`log_to_console()` shows the log messages again, e.g. in a notebook.
+"""
+
+import time
+import logging
+import threading
+import contextlib
+
+
+logger = logging.getLogger("skyboxdatapy")
+logger.addHandler(logging.NullHandler())
+_stage_logger = logging.getLogger("skyboxdatapy.profiling")
+
+
+# ==============================================================================
+
+# Number of active profiles; the stages only record while it is > 0
+_active = 0
+_lock = threading.Lock()
+_reports = []
+
+
+# ==============================================================================
+
+class Report:
+    """Accumulated calls, seconds and bytes per stage of a `profile`."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds, nbytes):
+        calls, s, b = self.stages.get(name, (0, 0.0, 0))
+        self.stages.update({name: (calls + 1, s + seconds, b + nbytes)})
+
+    def merge(self, stages: dict):
+        """Add the `stages` of another report, e.g. from a worker process."""
+
+        for name, (calls, seconds, nbytes) in stages.items():
+            c, s, b = self.stages.get(name, (0, 0.0, 0))
+            self.stages.update({name: (c + calls, s + seconds, b + nbytes)})
+
+    def to_frame(self):
+        """Stages as a pandas DataFrame, sorted by time."""
+
+        import pandas as pd
+
+        df = pd.DataFrame.from_dict(self.stages, orient="index",
+            columns=["calls", "seconds", "bytes"])
+        df.index.name = "stage"
+        df["MB/s"] = df["bytes"].where(df["bytes"] > 0) / df["seconds"] / 1e6
+        return df.sort_values("seconds", ascending=False)
+
+    def __repr__(self):
+        return repr(self.to_frame())
+
+
+# ==============================================================================
+
+class _Stage:
+    """Byte counter of a running stage, see `stage`."""
+
+    __slots__ = ("nbytes",)
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+@contextlib.contextmanager
+def stage(name: str, nbytes: int = 0):
+    """
+    Time a stage of a computation.
+
+    The yielded object has an `nbytes` counter that can be increased inside
+    the block, e.g. by the bytes read. Stages are recorded in the active
+    profiles and logged at DEBUG level on the "skyboxdatapy.profiling" logger.
+
+    Args:
+    - name: Name of the stage, e.g. "hdf5_read".
+    - nbytes: Bytes processed, if known before the block.
+
+    Examples:
+
+        >>> with stage("hdf5_read") as st:
+        ...     arr = dset[()]
+        ...     st.nbytes += arr.nbytes
+    """
+
+    st = _Stage(nbytes)
+    if not _active and not _stage_logger.isEnabledFor(logging.DEBUG):
+        yield st
+        return
+
+    t0 = time.perf_counter()
+    try:
+        yield st
+    finally:
+        seconds = time.perf_counter() - t0
+        with _lock:
+            for report in _reports:
+                report.add(name, seconds, st.nbytes)
+        _stage_logger.debug("%s: %.3f s, %d bytes", name, seconds, st.nbytes)
+
+
+# ==============================================================================
+
+@contextlib.contextmanager
+def profile():
+    """
+    Record the stages run inside the block, in all threads.
+
+    Returns:
+    - Report: Filled when the block runs, see `Report.to_frame`.
+    """
+
+    global _active
+
+    report = Report()
+    with _lock:
+        _reports.append(report)
+        _active += 1
+    try:
+        yield report
+    finally:
+        with _lock:
+            _reports.remove(report)
+            _active -= 1
+
+
+# ==============================================================================
+
+def log_to_console(level=logging.INFO):
+    """
+    Print the log messages of skyboxdatapy, e.g. in a notebook.
+
+    Args:
+    - level: Logging level, logging.DEBUG also shows every stage.
+        - Default value: logging.INFO
+    """
+
+    if not any(getattr(h, "_skyboxdatapy", False) for h in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._skyboxdatapy = True
+        logger.addHandler(handler)
+    logger.setLevel(level)
@@ -1,4 +1,14 @@
+import logging
+import threading
+from pathlib import Path
+
 import numpy as np
+import scipy as sp
+
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
 
 def get_single_sided_spectrum(wv_ele, fs):
     """
@@ -25,18 +35,20 @@ def get_single_sided_spectrum(wv_ele, fs):
     - The function ensures the input signal length is even for FFT computation.
     - The amplitude spectrum is normalized and scaled for single-sided representation.
     - The power spectral density is computed per frequency bin.
-    - Also prints sample length, frequency resolution, and maximum frequency.
+    - Also logs sample length, frequency resolution, and maximum frequency.
 
     """
 
     sz = (len(wv_ele) // 2) * 2  # Make it even
-    wv_ele = wv_ele[:sz]
+    # float32 signals are transformed in float64
+    wv_ele = np.asarray(wv_ele[:sz], dtype=np.float64)
 
-    print("Sample Len =", sz)
-    print("Least count Hz =", fs / sz)
-    print("Max Freq (Half band) Hz =", fs / 2)
+    logger.info("Sample Len = %s", sz)
+    logger.info("Least count Hz = %s", fs / sz)
+    logger.info("Max Freq (Half band) Hz = %s", fs / 2)
 
-    fAmp = np.fft.fft(wv_ele)
+    with skb_profiling.stage("fft", np.asarray(wv_ele).nbytes):
+        fAmp = np.fft.fft(wv_ele)
     fAmp = np.abs(fAmp / sz)
     fAmp = fAmp[:sz // 2 + 1]
     fAmp[1:-1] = 2 * fAmp[1:-1]
@@ -54,3 +66,379 @@ def get_single_sided_spectrum(wv_ele, fs):
     fS = fAmp ** 2 / 2 / (fHalf[1] - fHalf[0])
 
     return fHalf, fAmp, fS
+
+
+# ==============================================================================
+
+def get_spectra(data, fs, *, probes=None, dim='Time', method='fft',
+    nperseg=None, noverlap=None, workers=-1, dtype=None):
+    """
+    Compute the single-sided amplitude and power spectra of many probes at once.
+
+    Batched version of `get_single_sided_spectrum`: all probes are
+    transformed in one real FFT along time, using `workers` threads.
+    With method 'welch' the PSD is averaged over overlapping segments,
+    which lowers the variance at the cost of frequency resolution.
+
+    Parameters
+    ----------
+    - data : ndarray, xr.DataArray or xr.Dataset <br>
+        Signals with time along the last axis, e.g. (probe, time). A Dataset 
+        can have one variable per probe or the stacked `probes` variable 
+        from `io.convert_dict_to_xarray(..., layout="stacked")`.
+    - fs : float <br>
+        Sampling frequency of the signals in Hz.
+    - probes : list of str, optional <br>
+        Probes to use from a Dataset or DataArray. Default is all. A 
+        DataArray needs a 'probe' dimension, select a single probe before.
+    - dim : str, optional <br>
+        Time dimension of xarray inputs. Default is 'Time'.
+    - method : str, optional <br>
+        'fft' for the single-sided spectrum of the full record (same scaling
+        as `get_single_sided_spectrum`) or 'welch' for Welch averaging.
+    - nperseg : int, optional <br>
+        Samples per Welch segment. Default is 1/8 of the record.
+    - noverlap : int, optional <br>
+        Overlapping samples between Welch segments. Default is nperseg // 2.
+    - workers : int, optional <br>
+        Threads used by `scipy.fft`. Default is -1, all cores.
+    - dtype : dtype, optional <br>
+        dtype of the returned spectra, e.g. np.float32. The FFT always runs
+        in float64. Default is float64.
+
+    Returns
+    -------
+    - xr.Dataset <br>
+        Variables `amplitude` and `psd` with dimensions (probe, frequency).
+
+    Example
+    -------
+
+        >>> spec = get_spectra(ds.sel(Time=slice(30, 80)), 2000, probes=['WG01', 'WG02'])
+        >>> spec['amplitude'].sel(probe='WG01').plot()
+    """
+
+    import xarray as xr
+
+    values, names = _get_probe_matrix(data, probes, dim)
+    values = values.astype(np.float64, copy=False)
+    nt = values.shape[-1]
+
+    if method == 'fft':
+        sz = (nt // 2) * 2  # Make it even
+        with skb_profiling.stage("fft", values.nbytes):
+            fAmp = np.abs(sp.fft.rfft(values[..., :sz], axis=-1, workers=workers))
+        fAmp /= sz
+        fAmp[..., 1:-1] *= 2
+        fHalf = fs * np.arange(sz // 2 + 1) / sz
+        fS = fAmp ** 2 / 2 / (fHalf[1] - fHalf[0])
+
+    elif method == 'welch':
+        if nperseg is None:
+            nperseg = max(nt // 8, 2)
+        with skb_profiling.stage("fft", values.nbytes):
+            fHalf, fS = sp.signal.welch(values, fs=fs, nperseg=nperseg,
+                noverlap=noverlap, axis=-1)
+        fAmp = np.sqrt(2 * fS * (fHalf[1] - fHalf[0]))
+
+    else:
+        raise ValueError(f"Unknown method {method}, use 'fft' or 'welch'")
+
+    if dtype is not None:
+        fAmp = fAmp.astype(dtype, copy=False)
+        fS = fS.astype(dtype, copy=False)
+
+    return xr.Dataset(
+        {
+            'amplitude': (('probe', 'frequency'), fAmp),
+            'psd': (('probe', 'frequency'), fS),
+        },
+        coords={'probe': names, 'frequency': fHalf},
+        attrs={'fSampling': fs, 'method': method, 'nSamples': nt},
+    )
+
+
+# ==============================================================================
+
+def _get_probe_matrix(data, probes, dim):
+    """Signals as a 2D (probe, time) array and the probe names."""
+
+    import xarray as xr
+
+    if isinstance(data, xr.Dataset):
+        if 'probes' in data.data_vars and data['probes'].ndim == 2:
+            data = data['probes']
+        else:
+            if probes is None:
+                probes = [k for k, v in data.data_vars.items() if v.dims == (dim,)]
+            data = data[probes].to_dataarray('probe')
+            probes = None
+
+    if isinstance(data, xr.DataArray):
+        if probes is not None:
+            if 'probe' not in data.dims:
+                raise ValueError(f"probes needs a DataArray with a 'probe' "
+                    f"dimension, got dims {data.dims}")
+            data = data.sel(probe=probes)
+        if data.ndim == 1:
+            names = [data.name]
+            values = data.values[np.newaxis, :]
+        else:
+            other = [d for d in data.dims if d != dim][0]
+            data = data.transpose(other, dim)
+            names = list(data[other].values)
+            values = data.values
+        return values, names
+
+    values = np.atleast_2d(np.asarray(data))
+    return values, list(range(values.shape[0]))
+
+
+# ==============================================================================
+
+def get_bulk_parameters(spec, *, fmin=None, fmax=None, bands=None,
+    refine='parabolic'):
+    """
+    Spectral moments and bulk wave parameters from a PSD.
+
+    All probes (and any other dimension, e.g. `case`) are processed at once.
+    The moments are integrated with the trapezoidal rule over [fmin, fmax]:
+
+        mn = integral of f**n * S(f) df
+
+    Parameters
+    ----------
+    - spec : xr.Dataset or xr.DataArray <br>
+        Output of `get_spectra` (its `psd` is used) or a PSD with a
+        'frequency' dimension.
+    - fmin, fmax : float, optional <br>
+        Frequency band of the moments and of the peak search in Hz.
+        Default is the full spectrum. Excluding f = 0 avoids the mean level.
+    - bands : dict, optional <br>
+        Name -> (f0, f1) of bands whose energy (m0 in the band) is returned,
+        e.g. {'swell': (0.2, 0.6), 'wind': (0.6, 2.0)}.
+    - refine : str or None, optional <br>
+        'parabolic' to refine the peak frequency with a parabola through the
+        3 highest PSD values, None for the frequency bin. Default 'parabolic'.
+
+    Returns
+    -------
+    - xr.Dataset <br>
+        Variables `m0`, `m1`, `m2`, `Hm0` (4 sqrt(m0)), `Tp`, `fp`, `Tm01`
+        (m0/m1) and `Tm02` (sqrt(m0/m2)), and `band_energy` with an extra
+        `band` dimension if `bands` is given.
+
+    Example
+    -------
+
+        >>> spec = get_spectra(ds.sel(Time=slice(30, 180)), 2000)
+        >>> get_bulk_parameters(spec, fmin=0.1, fmax=5)[['Hm0', 'Tp']].to_dataframe()
+    """
+
+    import xarray as xr
+
+    psd = spec['psd'] if isinstance(spec, xr.Dataset) else spec
+    f = psd['frequency']
+
+    inBand = np.ones(f.size, dtype=bool)
+    if fmin is not None:
+        inBand &= f.values >= fmin
+    if fmax is not None:
+        inBand &= f.values <= fmax
+    S = psd.isel(frequency=np.flatnonzero(inBand))
+    fb = S['frequency']
+
+    with skb_profiling.stage("spectral_moments", S.nbytes):
+        m0 = S.integrate('frequency')
+        m1 = (S * fb).integrate('frequency')
+        m2 = (S * fb ** 2).integrate('frequency')
+        fp = _get_peak_frequency(S, refine)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = xr.Dataset({
+            'm0': m0,
+            'm1': m1,
+            'm2': m2,
+            'Hm0': 4 * np.sqrt(m0),
+            'fp': fp,
+            'Tp': 1 / fp,
+            'Tm01': m0 / m1,
+            'Tm02': np.sqrt(m0 / m2),
+        })
+
+    if bands:
+        energy = []
+        for f0, f1 in bands.values():
+            sel = (f.values >= f0) & (f.values <= f1)
+            energy.append(psd.isel(frequency=np.flatnonzero(sel)).integrate('frequency'))
+        out['band_energy'] = xr.concat(energy, dim='band').assign_coords(
+            band=list(bands))
+
+    out.attrs = {'fmin': fmin if fmin is not None else float(f[0]),
+        'fmax': fmax if fmax is not None else float(f[-1])}
+    return out
+
+
+# ==============================================================================
+
+def get_campaign_bulk_parameters(cases, fs=None, *, names=None,
+    group='DefaultData', probes=None, time=None, method='fft', nperseg=None,
+    fmin=None, fmax=None, bands=None, refine='parabolic', max_workers=None):
+    """
+    Bulk wave parameters of many probes and cases in one call.
+
+    The spectra of the cases are computed concurrently in a thread pool and
+    memoized: calling again with the same files and spectrum options (e.g.
+    with another frequency band) reuses them without any FFT. The memo of a
+    file is dropped when its size or mtime changes, see `clear_spectra_memo`.
+
+    Parameters
+    ----------
+    - cases : list of str or Path, or dict <br>
+        MAT files of the cases, or case name -> Dataset. Datasets are not
+        memoized.
+    - fs : float, optional <br>
+        Sampling frequency in Hz. Default is `TestProperties.fSampling` of
+        each file; required for Datasets.
+    - names : list of str, optional <br>
+        Case names, in the order of `cases`. Default is the file stems or
+        the keys of the dict.
+    - group : str, optional <br>
+        Time series group of the files. Default is 'DefaultData'.
+    - probes : list of str, optional <br>
+        Probes to use. Default is all probes of each case.
+    - time : tuple, optional <br>
+        Time window (t0, t1) of the spectra, as in `io.load_case`.
+    - method, nperseg : optional <br>
+        Spectrum options, see `get_spectra`.
+    - fmin, fmax, bands, refine : optional <br>
+        Bulk parameter options, see `get_bulk_parameters`.
+    - max_workers : int, optional <br>
+        Number of threads. Default from `concurrent.futures`.
+
+    Returns
+    -------
+    - xr.Dataset <br>
+        Output of `get_bulk_parameters` with dimensions (case, probe).
+        Probes missing in a case are NaN.
+
+    Example
+    -------
+
+        >>> files = sorted(Path("../data_nosync").rglob("Test1*.mat"))
+        >>> bulk = get_campaign_bulk_parameters(files, probes=['WG01', 'WG05'], fmin=0.1, fmax=5)
+        >>> bulk['Hm0'].to_pandas()
+    """
+
+    import xarray as xr
+    from concurrent.futures import ThreadPoolExecutor
+
+    if isinstance(cases, dict):
+        if names is None:
+            names = list(cases)
+        cases = list(cases.values())
+    else:
+        cases = list(cases)
+        if names is None:
+            names = [Path(c).stem for c in cases]
+
+    options = {'group': group, 'probes': tuple(probes) if probes else None,
+        'time': tuple(time) if time else None, 'method': method,
+        'nperseg': nperseg, 'fs': fs}
+
+    def get_case_spectra(case):
+        if isinstance(case, xr.Dataset):
+            if fs is None:
+                raise ValueError("fs is needed for Dataset cases")
+            data = case if time is None else case.sel(Time=slice(*time))
+            return get_spectra(data, fs, probes=probes, method=method,
+                nperseg=nperseg, workers=1)
+        return _get_memoized_spectra(case, options)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        spectra = list(pool.map(get_case_spectra, cases))
+
+    bulk = [get_bulk_parameters(s, fmin=fmin, fmax=fmax, bands=bands,
+        refine=refine) for s in spectra]
+    return xr.concat(bulk, dim='case', join='outer').assign_coords(case=names)
+
+
+def clear_spectra_memo():
+    """Drop the spectra memoized by `get_campaign_bulk_parameters`."""
+
+    with _memo_lock:
+        _spectra_memo.clear()
+
+
+# ==============================================================================
+
+# Spectra of the files seen by `get_campaign_bulk_parameters`, by
+# (path, size, mtime, options), oldest first
+_spectra_memo = {}
+_memo_lock = threading.Lock()
+_memo_max_entries = 256
+
+
+def _get_memoized_spectra(file, options):
+    """Spectra of a MAT file, computed once per file version and options."""
+
+    from . import io as skb_io
+
+    file = Path(file).resolve()
+    st = file.stat()
+    key = (str(file), st.st_size, st.st_mtime_ns,
+        tuple(sorted(options.items())))
+    with _memo_lock:
+        if key in _spectra_memo:
+            return _spectra_memo[key]
+
+    # TestProperties are only needed for fSampling, files may not have them
+    fs = options['fs']
+    groups = [options['group']] + (['TestProperties'] if fs is None else [])
+    case = skb_io.load_case(file, groups=groups,
+        probes=list(options['probes']) if options['probes'] else None,
+        time=options['time'])
+    if fs is None:
+        fs = float(case['TestProperties']['fSampling'])
+    spec = get_spectra(case[options['group']], fs, method=options['method'],
+        nperseg=options['nperseg'], workers=1)
+
+    with _memo_lock:
+        _spectra_memo.update({key: spec})
+        while len(_spectra_memo) > _memo_max_entries:
+            _spectra_memo.pop(next(iter(_spectra_memo)))
+    return spec
+
+
+def _get_peak_frequency(S, refine):
+    """Frequency of the PSD peak along 'frequency', for all other dims."""
+
+    import xarray as xr
+
+    if refine not in ('parabolic', None):
+        raise ValueError(f"Unknown refine method {refine}, use 'parabolic' or None")
+
+    S = S.transpose(..., 'frequency')
+    f = S['frequency'].values
+    vals = S.values
+    if f.size == 0:
+        return xr.DataArray(np.full(vals.shape[:-1], np.nan),
+            dims=S.dims[:-1], coords={d: S[d] for d in S.dims[:-1] if d in S.coords})
+
+    iMax = np.argmax(np.nan_to_num(vals, nan=-np.inf), axis=-1)
+    fp = f[iMax]
+
+    if refine == 'parabolic' and f.size >= 3:
+        i = np.clip(iMax, 1, f.size - 2)
+        ym = np.take_along_axis(vals, (i - 1)[..., None], axis=-1)[..., 0]
+        y0 = np.take_along_axis(vals, i[..., None], axis=-1)[..., 0]
+        yp = np.take_along_axis(vals, (i + 1)[..., None], axis=-1)[..., 0]
+        denom = ym - 2*y0 + yp
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.where(denom != 0, 0.5 * (ym - yp) / denom, 0.0)
+        # No refinement at the edges of the band
+        edge = (iMax == 0) | (iMax == f.size - 1)
+        fp = np.where(edge, fp, fp + delta * (f[1] - f[0]))
+
+    return xr.DataArray(fp, dims=S.dims[:-1],
+        coords={d: S[d] for d in S.dims[:-1] if d in S.coords})
@@ -0,0 +1,381 @@
+"""Zero-crossing wave statistics of the wave gauges.
+
+The surface elevation of all gauges is analysed at once: the zero crossings,
+crests and troughs of all probes are found with a few NumPy operations on the
+(probe, time) matrix, without a loop over gauges or waves. Long records are
+processed in blocks of `chunk_size` samples; the unfinished wave of each gauge
+is carried to the next block, so the result does not depend on the block size
+and lazy (cache or dask backed) Datasets are never loaded whole:
+
+    >>> case = skb.io.load_case(file, groups=["DefaultData"], chunks=2**16)
+    >>> stats = get_wave_statistics(case["DefaultData"], chunk_size=2**18)
+    >>> stats["H1/3"].sel(probe="WG05")
+"""
+
+import logging
+
+import numpy as np
+import xarray as xr
+
+from . import io as skb_io
+from . import spec as skb_spec
+from . import profiling as skb_profiling
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+
+def get_zero_crossing_waves(data, fs=None, *, probes=None, dim='Time',
+    crossing='up', mean_level='mean', chunk_size=None) -> xr.Dataset:
+    """
+    Individual waves of many probes by zero-crossing analysis.
+
+    A wave lasts from one zero crossing of the elevation to the next one in
+    the same direction. The crossing times are linearly interpolated between
+    samples. Incomplete waves at the start and end of the record are not
+    counted. NaN samples (e.g. padded cases) never cross zero.
+
+    Parameters
+    ----------
+    - data : xr.Dataset, xr.DataArray or ndarray
+        - Elevations with time along `dim`, e.g. `case['DefaultData']`. A
+        Dataset can have one variable per probe or the stacked layout.
+    - fs : float, optional
+        - Sampling frequency in Hz, only used for ndarray input.
+    - probes : list of str, optional
+        - Probes to analyse. Default is the wave gauges (WG01-WG09) of a
+        Dataset, or all probes if it has none.
+    - dim : str, optional
+        - Time dimension. Default is 'Time'.
+    - crossing : str, optional
+        - 'up' for zero up-crossing waves, 'down' for zero down-crossing.
+    - mean_level : 'mean', float or None, optional
+        - Level of the zero crossings: 'mean' for the mean of each probe
+        (one extra pass over lazy data), a value subtracted from all probes,
+        or None to use the elevation as is. Default is 'mean'.
+    - chunk_size : int, optional
+        - Samples processed at once. Default is None, the whole record.
+
+    Returns
+    -------
+    - xr.Dataset
+        - Variables `time` (start of the wave), `period`, `height`, `crest`
+        and `trough` with dimensions (probe, wave), NaN padded, and
+        `nWaves` and `mean_level` with dimension (probe,).
+
+    Example
+    -------
+
+        >>> waves = get_zero_crossing_waves(ds, probes=['WG01', 'WG02'])
+        >>> waves['height'].sel(probe='WG01').dropna('wave')
+    """
+
+    waves, names, level, _ = _get_waves(data, fs, probes, dim, crossing,
+        mean_level, chunk_size)
+    return _get_wave_table(waves, names, level, crossing)
+
+
+# ==============================================================================
+
+def get_wave_statistics(data, fs=None, *, probes=None, dim='Time',
+    crossing='up', mean_level='mean', chunk_size=None) -> xr.Dataset:
+    """
+    Summary wave statistics of many probes by zero-crossing analysis.
+
+    Parameters
+    ----------
+    - data, fs, probes, dim, crossing, mean_level, chunk_size
+        - As in `get_zero_crossing_waves`.
+
+    Returns
+    -------
+    - xr.Dataset
+        - Variables with dimension (probe,):
+            - `Hs`: 4 times the standard deviation of the elevation.
+            - `H1/3`, `H1/10`: Mean height of the highest third and tenth
+            of the waves, `T1/3`: mean period of the highest third.
+            - `Hmax` and its period `THmax`, `Hmean`, `Hrms`.
+            - `Tz`: mean zero-crossing period.
+            - `crest_max`, `trough_min`: highest crest and lowest trough
+            relative to the mean level.
+            - `nWaves`.
+
+    Example
+    -------
+
+        >>> stats = get_wave_statistics(ds.sel(Time=slice(30, 180)))
+        >>> stats[['Hs', 'H1/3', 'Tz']].to_dataframe()
+    """
+
+    waves, names, level, moments = _get_waves(data, fs, probes, dim,
+        crossing, mean_level, chunk_size)
+    table = _get_wave_table(waves, names, level, crossing)
+
+    H = table['height'].values
+    T = table['period'].values
+    nWaves = table['nWaves'].values
+    rows = np.arange(H.shape[0])
+
+    # Heights in descending order, NaN padding last
+    order = np.argsort(np.where(np.isnan(H), np.inf, -H), axis=1)
+    Hsorted = np.take_along_axis(H, order, axis=1)
+    Tsorted = np.take_along_axis(T, order, axis=1)
+
+    def top_mean(vals, fraction):
+        n = nWaves // fraction
+        csum = np.cumsum(np.nan_to_num(vals), axis=1)
+        csum = np.concatenate([np.zeros((len(n), 1)), csum], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 0, csum[rows, n] / n, np.nan)
+
+    # Mean and mean square of the elevation above the mean level
+    mean, m2 = moments
+    crest = table['crest'].values
+    trough = table['trough'].values
+    hasWaves = nWaves > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Hs = 4 * np.sqrt(m2 - mean ** 2)
+        Hmax = np.where(hasWaves, Hsorted[:, 0] if H.shape[1] else np.nan, np.nan)
+        THmax = np.where(hasWaves, Tsorted[:, 0] if H.shape[1] else np.nan, np.nan)
+        Hmean = np.nansum(H, axis=1) / nWaves
+        Hrms = np.sqrt(np.nansum(H ** 2, axis=1) / nWaves)
+        Tz = np.nansum(T, axis=1) / nWaves
+        crest = np.where(hasWaves, np.max(np.where(np.isnan(crest), -np.inf, crest),
+            axis=1, initial=-np.inf), np.nan)
+        trough = np.where(hasWaves, np.min(np.where(np.isnan(trough), np.inf, trough),
+            axis=1, initial=np.inf), np.nan)
+
+    return xr.Dataset(
+        {
+            'Hs': ('probe', Hs),
+            'H1/3': ('probe', top_mean(Hsorted, 3)),
+            'H1/10': ('probe', top_mean(Hsorted, 10)),
+            'T1/3': ('probe', top_mean(Tsorted, 3)),
+            'Hmax': ('probe', Hmax),
+            'THmax': ('probe', THmax),
+            'Hmean': ('probe', Hmean),
+            'Hrms': ('probe', Hrms),
+            'Tz': ('probe', Tz),
+            'crest_max': ('probe', crest),
+            'trough_min': ('probe', trough),
+            'nWaves': ('probe', nWaves),
+        },
+        coords={'probe': names},
+        attrs={'crossing': crossing},
+    )
+
+
+# ==============================================================================
+
+def _get_waves(data, fs, probes, dim, crossing, mean_level, chunk_size):
+    """Waves of all probes, see `get_zero_crossing_waves`.
+
+    Returns the wave arrays (probe index, start, end, crest, trough) in time
+    order per probe, the probe names, the mean level of each probe and the
+    mean and mean square of the elevation above it.
+    """
+
+    if crossing not in ('up', 'down'):
+        raise ValueError(f"Unknown crossing {crossing}, use 'up' or 'down'")
+
+    if probes is None and isinstance(data, xr.Dataset):
+        if 'probes' in data.data_vars and data['probes'].ndim == 2:
+            names = [str(p) for p in data['probe'].values]
+        else:
+            names = [k for k, v in data.data_vars.items() if v.dims == (dim,)]
+        wave_gauges = [p for p in names if skb_io.get_probe_type(p) == 'WG']
+        probes = wave_gauges if wave_gauges else None
+
+    if isinstance(data, (xr.Dataset, xr.DataArray)):
+        nt = data.sizes[dim]
+        time = data[dim].values
+    else:
+        if fs is None:
+            raise ValueError("fs is needed for ndarray input")
+        nt = np.shape(data)[-1]
+        time = np.arange(nt) / fs
+    if chunk_size is None:
+        chunk_size = max(nt, 1)
+
+    def blocks():
+        for i0 in range(0, nt, chunk_size):
+            i1 = min(i0 + chunk_size, nt)
+            if isinstance(data, (xr.Dataset, xr.DataArray)):
+                block = data.isel({dim: slice(i0, i1)})
+            else:
+                block = np.asarray(data)[..., i0:i1]
+            values, names = skb_spec._get_probe_matrix(block, probes, dim)
+            yield values.astype(np.float64, copy=False), names, time[i0:i1]
+
+    # Moments of the elevation, with a first pass for the mean level
+    count = sum1 = sum2 = 0
+    if mean_level == 'mean':
+        for values, names, _ in blocks():
+            count = count + np.sum(~np.isnan(values), axis=1)
+            sum1 = sum1 + np.nansum(values, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            level = sum1 / count
+        count = sum1 = 0
+    elif mean_level is None:
+        level = 0.0
+    else:
+        level = float(mean_level)
+
+    sign = 1.0 if crossing == 'up' else -1.0
+    carry = None
+    parts = []
+    names = []
+    with skb_profiling.stage("zero_crossing") as st:
+        for values, names, t in blocks():
+            st.nbytes += values.nbytes
+            eta = values - np.reshape(level, (-1, 1))
+            count = count + np.sum(~np.isnan(eta), axis=1)
+            sum1 = sum1 + np.nansum(eta, axis=1)
+            sum2 = sum2 + np.nansum(eta ** 2, axis=1)
+
+            if carry is None:
+                carry = _init_carry(eta.shape[0])
+            part, carry = _get_block_waves(sign * eta, t, carry)
+            parts.append(part)
+
+    if not parts:
+        parts = [tuple(np.empty(0) for _ in range(5))]
+    waves = [np.concatenate(a) for a in zip(*parts)]
+    waves[0] = waves[0].astype(np.intp)
+
+    # The crest of a down-crossing analysis is the lowest point of -eta
+    if sign < 0:
+        waves[3], waves[4] = -waves[4], -waves[3]
+
+    # Blocks keep the order within a probe, sort by probe only
+    order = np.argsort(waves[0], kind='stable')
+    waves = [a[order] for a in waves]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sum1 / count
+        m2 = sum2 / count
+    level = np.broadcast_to(np.asarray(level, dtype=np.float64), (len(names),))
+    return waves, names, level, (mean, m2)
+
+
+def _init_carry(nProbes):
+    """State of the unfinished wave of each probe before the first block."""
+
+    return {
+        'x': np.full(nProbes, np.nan),        # last sample of the last block
+        't': np.full(nProbes, np.nan),        # its time
+        'tCross': np.full(nProbes, np.nan),   # last crossing, NaN if none yet
+        'max': np.full(nProbes, np.nan),      # extremes since the last crossing
+        'min': np.full(nProbes, np.nan) }
+
+
+def _get_block_waves(eta, t, carry):
+    """Up-crossing waves completed in a (probe, time) block of elevations.
+
+    The last sample of the previous block is put in front of the block so
+    that crossings on the block boundary are found. Segments start at each
+    crossing and at column 1 of each row, and their extremes are found with
+    one `reduceat` over the flattened block.
+    """
+
+    nProbes, nt = eta.shape
+    ext = np.empty((nProbes, nt + 1))
+    ext[:, 0] = carry['x']
+    ext[:, 1:] = eta
+    tExt = np.empty((nProbes, nt + 1))
+    tExt[:, 0] = carry['t']
+    tExt[:, 1:] = t
+    m1 = nt + 1
+
+    # Crossing between columns j and j + 1, the new wave starts at j + 1
+    rows, cols = np.nonzero((ext[:, :-1] < 0) & (ext[:, 1:] >= 0))
+    x0 = ext[rows, cols]
+    x1 = ext[rows, cols + 1]
+    tCross = tExt[rows, cols] + x0 / (x0 - x1) * (tExt[rows, cols + 1] - tExt[rows, cols])
+
+    # Column 0 belongs to the previous block, fmax/fmin skip NaN
+    red = ext.copy()
+    red[:, 0] = np.nan
+    red = red.ravel()
+    flatCross = rows * m1 + cols + 1
+    flatHead = np.arange(nProbes) * m1 + 1
+    starts = np.union1d(flatCross, flatHead)
+    with np.errstate(invalid='ignore'):
+        segMax = np.fmax.reduceat(red, starts)
+        segMin = np.fmin.reduceat(red, starts)
+
+    iCross = np.searchsorted(starts, flatCross)
+    crossMax = segMax[iCross]
+    crossMin = segMin[iCross]
+    headOnly = ~np.isin(flatHead, flatCross)
+    iHead = np.searchsorted(starts, flatHead)
+    headMax = np.where(headOnly, segMax[iHead], np.nan)
+    headMin = np.where(headOnly, segMin[iHead], np.nan)
+
+    nCross = np.bincount(rows, minlength=nProbes)
+    hasCross = nCross > 0
+    first = np.cumsum(nCross) - nCross
+    last = first + nCross - 1
+
+    # Waves between two crossings of this block
+    inner = np.ones(rows.size, dtype=bool)
+    inner[last[hasCross]] = False
+    iInner = np.flatnonzero(inner)
+
+    # Waves ending at the first crossing of a row, started in a former block
+    done = hasCross & ~np.isnan(carry['tCross'])
+    pDone = np.flatnonzero(done)
+    iFirst = first[done]
+
+    probe = np.concatenate([pDone, rows[iInner]])
+    start = np.concatenate([carry['tCross'][done], tCross[iInner]])
+    end = np.concatenate([tCross[iFirst], tCross[iInner + 1]])
+    crest = np.concatenate([
+        np.fmax(carry['max'][done], headMax[done]), crossMax[iInner]])
+    trough = np.concatenate([
+        np.fmin(carry['min'][done], headMin[done]), crossMin[iInner]])
+    order = np.lexsort((start, probe))
+
+    newCarry = {
+        'x': ext[:, -1],
+        't': tExt[:, -1],
+        'tCross': carry['tCross'].copy(),
+        'max': np.fmax(carry['max'], headMax),
+        'min': np.fmin(carry['min'], headMin) }
+    iLast = last[hasCross]
+    newCarry['tCross'][hasCross] = tCross[iLast]
+    newCarry['max'][hasCross] = crossMax[iLast]
+    newCarry['min'][hasCross] = crossMin[iLast]
+
+    part = (probe[order], start[order], end[order], crest[order], trough[order])
+    return part, newCarry
+
+
+def _get_wave_table(waves, names, level, crossing) -> xr.Dataset:
+    """NaN padded (probe, wave) Dataset of the waves."""
+
+    probe, start, end, crest, trough = waves
+    nWaves = np.bincount(probe, minlength=len(names))
+    first = np.cumsum(nWaves) - nWaves
+    col = np.arange(probe.size) - first[probe]
+
+    def pad(vals):
+        out = np.full((len(names), nWaves.max(initial=0)), np.nan)
+        out[probe, col] = vals
+        return out
+
+    return xr.Dataset(
+        {
+            'time': (('probe', 'wave'), pad(start)),
+            'period': (('probe', 'wave'), pad(end - start)),
+            'height': (('probe', 'wave'), pad(crest - trough)),
+            'crest': (('probe', 'wave'), pad(crest)),
+            'trough': (('probe', 'wave'), pad(trough)),
+            'nWaves': ('probe', nWaves),
+            'mean_level': ('probe', level),
+        },
+        coords={'probe': names},
+        attrs={'crossing': crossing},
+    )
@@ -0,0 +1,52 @@
+"""Catalog lookups give the same result as walking the tree."""
+
+import pytest
+
+from skyboxdatapy import io as skb_io
+
+
+# ==============================================================================
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "data"
+    for d in ("d1008/Measure_XLS", "d1009/Measure_XLS"):
+        (root / d).mkdir(parents=True)
+    (root / "d1008/Measure_XLS/Test170.csv").write_text("")
+    (root / "d1009/Measure_XLS/Test180.csv").write_text("")
+    return root
+
+
+def _find(root, testName):
+    return skb_io.find_unique_file(root, testName, "csv", catalog=True)
+
+
+# ==============================================================================
+
+def test_find(tree):
+    assert _find(tree, "Test170") == str(tree / "d1008/Measure_XLS/Test170.csv")
+    with pytest.raises(ValueError, match="found 2"):
+        _find(tree, "Test1")
+
+
+def test_new_file_is_found(tree):
+    with pytest.raises(ValueError, match="found 0"):
+        _find(tree, "Test171")
+
+    new = tree / "d1008/Measure_XLS/Test171.csv"
+    new.write_text("")
+    assert _find(tree, "Test171") == str(new)
+
+    (tree / "d1010/Measure_XLS").mkdir(parents=True)
+    new = tree / "d1010/Measure_XLS/Test190.csv"
+    new.write_text("")
+    assert _find(tree, "Test190") == str(new)
+
+
+def test_deleted_file_is_not_found(tree):
+    assert _find(tree, "Test180")
+
+    (tree / "d1009/Measure_XLS/Test180.csv").unlink()
+    with pytest.raises(ValueError, match="found 0"):
+        _find(tree, "Test180")
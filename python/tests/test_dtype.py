@@ -0,0 +1,118 @@
+"""float32 probe storage against the float64 reference.
+
+Each stage of the float32 path (load, tare, resample, spectra) has to keep
+float32 and stay within `rtol` of the same stage run in float64. Values are
+compared relative to the largest value of the reference, so samples near
+zero are not held to a relative tolerance they cannot meet in float32.
+"""
+
+import numpy as np
+import pytest
+
+from skyboxdatapy import io as skb_io
+from skyboxdatapy import postprocess as skb_pp
+from skyboxdatapy import spec as skb_spec
+
+from benchmarks.common import fSampling, make_case
+
+
+rtol = 1e-6
+probes = ["WG01", "WG02", "Mo01", "PS01"]
+
+
+# ==============================================================================
+
+@pytest.fixture(scope="module")
+def case_file(tmp_path_factory):
+    file = tmp_path_factory.mktemp("dtype") / "case.mat"
+    skb_io.save_hdf5_mat(file, make_case(20.0))
+    return file
+
+
+@pytest.fixture(scope="module")
+def ds64(case_file):
+    return skb_io.load_case(case_file, groups=["DefaultData"],
+        probes=probes)["DefaultData"]
+
+
+def _load32(case_file, **kwargs):
+    return skb_io.load_case(case_file, groups=["DefaultData"], probes=probes,
+        dtype=np.float32, **kwargs)["DefaultData"]
+
+
+def _assert_close(a, b, scale=None):
+    b = np.asarray(b, dtype=np.float64)
+    if scale is None:
+        scale = np.nanmax(np.abs(b))
+    np.testing.assert_allclose(np.asarray(a, dtype=np.float64), b, rtol=rtol,
+        atol=rtol * scale)
+
+
+def _as_stacked(ds):
+    """One variable per probe, from the stacked (probe, Time) layout."""
+
+    dsOut = ds["probes"].to_dataset(dim="probe")
+    dsOut.attrs = dict(ds.attrs)
+    return dsOut
+
+
+# ==============================================================================
+
+@pytest.mark.parametrize("kwargs", [{}, {"chunks": 2**12}, {"layout": "stacked"}],
+    ids=["eager", "chunked", "stacked"])
+def test_load_case(case_file, ds64, kwargs):
+    ds32 = _load32(case_file, **kwargs)
+    if kwargs.get("layout") == "stacked":
+        ds32 = _as_stacked(ds32)
+
+    for p in probes:
+        assert ds32[p].dtype == np.float32
+        _assert_close(ds32[p].values, ds64[p].values)
+    assert ds32["Time"].dtype == np.float64
+
+
+@pytest.mark.parametrize("layout", ["variables", "stacked"])
+@pytest.mark.parametrize("mode", ["copy", "inplace", "lazy"])
+def test_tare(case_file, ds64, mode, layout):
+    ref = skb_pp.set_all_probe_tare(ds64, 0.0, 2.0)
+    ds32 = _load32(case_file, layout=layout)
+
+    tared = skb_pp.set_all_probe_tare(ds32, 0.0, 2.0, mode=mode)
+    if mode == "lazy":
+        tared = skb_pp.apply_tare(tared)
+    if layout == "stacked":
+        tared = _as_stacked(tared)
+
+    for p in probes:
+        assert tared[p].dtype == np.float32
+        _assert_close(tared[p].values, ref[p].values)
+        # The tare is close to 0, compare it to the scale of the probe
+        _assert_close(tared.attrs["tare_values"][p],
+            ref.attrs["tare_values"][p], scale=np.abs(ds64[p].values).max())
+
+
+def test_resample(case_file, ds64):
+    ref = skb_pp.resample_to(ds64, 100, fSampling)
+    out = skb_pp.resample_to(_load32(case_file), 100, fSampling)
+
+    np.testing.assert_array_equal(out["Time"].values, ref["Time"].values)
+    for p in probes:
+        assert out[p].dtype == np.float32
+        _assert_close(out[p].values, ref[p].values)
+
+
+@pytest.mark.parametrize("layout", ["variables", "stacked"])
+def test_spectra(case_file, ds64, layout):
+    ref = skb_spec.get_spectra(ds64, fSampling, probes=probes)
+    spec = skb_spec.get_spectra(_load32(case_file, layout=layout), fSampling,
+        probes=probes, dtype=np.float32)
+
+    for name in ("amplitude", "psd"):
+        assert spec[name].dtype == np.float32
+        _assert_close(spec[name].sel(probe=probes).values,
+            ref[name].sel(probe=probes).values)
+
+    bulk = skb_spec.get_bulk_parameters(spec, fmin=0.1)
+    bulk64 = skb_spec.get_bulk_parameters(ref, fmin=0.1)
+    np.testing.assert_allclose(bulk["Hm0"].sel(probe=probes).values,
+        bulk64["Hm0"].sel(probe=probes).values, rtol=rtol)
@@ -0,0 +1,33 @@
+"""Lazy loading of MAT files."""
+
+import os
+
+import numpy as np
+
+from skyboxdatapy import io as skb_io
+
+from benchmarks.common import make_case
+
+
+# ==============================================================================
+
+def test_chunked_load_after_rewrite(tmp_path):
+    file = tmp_path / "Test1.mat"
+    skb_io.save_hdf5_mat(file, make_case(2.0, seed=0))
+    first = skb_io.load_case(file, groups=["DefaultData"], probes=["WG01"],
+        chunks=2**10)["DefaultData"]["WG01"]
+    values = first.values
+
+    # Rewrite the file in place, like the conversion does
+    tmp = tmp_path / ".Test1.tmp.mat"
+    skb_io.save_hdf5_mat(tmp, make_case(2.0, seed=1))
+    os.replace(tmp, file)
+    second = skb_io.load_case(file, groups=["DefaultData"], probes=["WG01"],
+        chunks=2**10)["DefaultData"]["WG01"]
+
+    assert second.data.name != first.data.name
+    assert not np.array_equal(second.values, values)
+    # The same file version gives the same keys
+    again = skb_io.load_case(file, groups=["DefaultData"], probes=["WG01"],
+        chunks=2**10)["DefaultData"]["WG01"]
+    assert again.data.name == second.data.name
@@ -0,0 +1,48 @@
+"""Campaign bulk parameters of MAT files."""
+
+import numpy as np
+import pytest
+
+from skyboxdatapy import io as skb_io
+from skyboxdatapy import spec as skb_spec
+
+from benchmarks.common import fSampling, make_case
+
+
+# ==============================================================================
+
+@pytest.fixture(scope="module")
+def case_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("spec")
+    case = make_case(10.0)
+    with_props = folder / "Test1.mat"
+    skb_io.save_hdf5_mat(with_props, case)
+
+    del case["TestProperties"]
+    without_props = folder / "Test2.mat"
+    skb_io.save_hdf5_mat(without_props, case)
+    return with_props, without_props
+
+
+# ==============================================================================
+
+def test_campaign_bulk_parameters(case_files):
+    skb_spec.clear_spectra_memo()
+    bulk = skb_spec.get_campaign_bulk_parameters(case_files, fs=fSampling,
+        probes=["WG01"], fmin=0.1)
+
+    assert list(bulk["case"].values) == ["Test1", "Test2"]
+    # Both files hold the same records
+    hm0 = bulk["Hm0"].sel(probe="WG01").values
+    assert np.all(np.isfinite(hm0))
+    np.testing.assert_allclose(hm0[1], hm0[0], rtol=1e-12)
+
+
+def test_campaign_bulk_parameters_fs_from_file(case_files):
+    skb_spec.clear_spectra_memo()
+    bulk = skb_spec.get_campaign_bulk_parameters(case_files[:1],
+        probes=["WG01"], fmin=0.1)
+    ref = skb_spec.get_campaign_bulk_parameters(case_files[:1], fs=fSampling,
+        probes=["WG01"], fmin=0.1)
+
+    np.testing.assert_allclose(bulk["Hm0"].values, ref["Hm0"].values)